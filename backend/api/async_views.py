@@ -0,0 +1,99 @@
+from contextlib import nullcontext
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+from django.urls import URLPattern
+
+from api.instrumentation import get_timings, instrument_connections
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Выгрузка списка покупок остаётся синхронной: потоковый ответ читается
+# в общем потоке синхронного кода (StreamingASGIHandler), где открыт
+# курсор базы, и не собирается целиком в памяти.
+ASYNC_ROUTES = {
+    'recipe-list',
+    'recipe-detail',
+    'recipe-feed',
+    'tag-list',
+    'tag-detail',
+    'ingredient-list',
+    'ingredient-detail',
+    'customuser-subscriptions',
+}
+
+
+def run_view(view, request, *args, **kwargs):
+    # Выполняется в пуле потоков: у каждого потока своё подключение к
+    # базе, которое закрывается по правилам CONN_MAX_AGE.
+    close_old_connections()
+    timings = get_timings(request)
+    try:
+        with instrument_connections(timings) if timings else nullcontext():
+            response = view(request, *args, **kwargs)
+            if callable(getattr(response, 'render', None)):
+                response = response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    # Синхронное представление DRF как асинхронное: чтение выполняется в
+    # пуле потоков и не блокирует цикл событий, запись — в общем
+    # потоке синхронного кода, как у Django по умолчанию.
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await sync_to_async(
+            run_view,
+            thread_sensitive=request.method not in READ_METHODS,
+        )(view, request, *args, **kwargs)
+    return wrapper
+
+
+def async_read_urls(urlpatterns):
+    return [
+        URLPattern(pattern.pattern, async_view(pattern.callback),
+                   pattern.default_args, pattern.name)
+        if pattern.name in ASYNC_ROUTES else pattern
+        for pattern in urlpatterns
+    ]
+
+
+class StreamingASGIHandler(ASGIHandler):
+    # Обработчик ASGI в Django 3.2 перебирает потоковый ответ в цикле
+    # событий, где запросы к базе запрещены. Здесь каждая часть ответа
+    # читается в общем потоке синхронного кода, в котором выполнялось
+    # представление и открыт его курсор.
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        headers = [
+            (header.encode('ascii'), value.encode('latin1'))
+            for header, value in response.items()
+        ]
+        headers += [
+            (b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+            for cookie in response.cookies.values()
+        ]
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': headers,
+        })
+        parts = iter(response)
+        next_part = sync_to_async(next, thread_sensitive=True)
+        while True:
+            part = await next_part(parts, None)
+            if part is None:
+                break
+            for chunk, _ in self.chunk_bytes(part):
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': True,
+                })
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
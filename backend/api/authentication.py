@@ -0,0 +1,86 @@
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from api import metrics
+
+SHARED_TIMEOUT = 5 * 60
+# Записи локального кеша не сбрасываются из других процессов, поэтому
+# живут недолго: отозванный токен принимается не дольше LOCAL_TIMEOUT.
+LOCAL_TIMEOUT = 10
+LOCAL_MAX_SIZE = 10000
+
+
+def token_cache_key(key):
+    # В общий кеш не попадает сам токен, только его хеш.
+    return f'auth:token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+class TokenCache:
+    # Снимок (пользователь, токен) по ключу токена: локальный LRU с
+    # TTL в процессе и общий кеш за ним. Значения хранятся
+    # сериализованными, каждый запрос получает свою копию пользователя.
+
+    def __init__(self, max_size=LOCAL_MAX_SIZE, timeout=LOCAL_TIMEOUT):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                metrics.increment('auth.local_hits')
+                return pickle.loads(entry[1])
+        packed = cache.get(token_cache_key(key))
+        if packed is None:
+            metrics.increment('auth.misses')
+            return None
+        metrics.increment('auth.shared_hits')
+        self._remember(key, packed)
+        return pickle.loads(packed)
+
+    def set(self, key, value):
+        packed = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        cache.set(token_cache_key(key), packed, SHARED_TIMEOUT)
+        self._remember(key, packed)
+
+    def delete(self, key):
+        cache.delete(token_cache_key(key))
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _remember(self, key, packed):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, packed)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    # TokenAuthentication без запроса Token JOIN User на каждый вызов API.
+    # Снимки сбрасываются сигналами при удалении токена и сохранении
+    # пользователя (api/signals.py).
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            cached = super().authenticate_credentials(key)
+            token_cache.set(key, cached)
+        user, token = cached
+        if not user.is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
+        return user, token
@@ -0,0 +1,78 @@
+import threading
+from bisect import bisect_left, bisect_right
+
+from django.db import connection
+
+from recipes.models import Ingredient
+from recipes.signals import INGREDIENTS_VERSION_KEY, get_version
+
+
+class IngredientIndex:
+    # Названия в нижнем регистре отсортированы, строки ответа лежат
+    # в параллельном списке, поэтому поиск по началу — это bisect.
+    # Для поиска по вхождению названия склеены в одну строку через '\n'.
+
+    def __init__(self):
+        self._state = (None, [], [], '', [])
+        self._lock = threading.Lock()
+        self._building = False
+
+    def search(self, query):
+        version = get_version(INGREDIENTS_VERSION_KEY)
+        index_version, keys, rows, haystack, offsets = self._state
+        if index_version != version:
+            self.rebuild_async(version)
+            return None
+        prefix = query.casefold()
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + '\U0010ffff', start)
+        matches = rows[start:end]
+        found = haystack.find(prefix) if '\n' not in prefix else -1
+        while found != -1:
+            position = bisect_right(offsets, found) - 1
+            if offsets[position] != found:
+                matches.append(rows[position])
+            if position + 1 == len(offsets):
+                break
+            found = haystack.find(prefix, offsets[position + 1])
+        return matches
+
+    def rebuild_async(self, version):
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._rebuild_in_thread, args=(version,),
+                         daemon=True).start()
+
+    def rebuild(self, version):
+        entries = sorted(
+            (name.casefold(), name, pk, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects
+            .values_list('id', 'name', 'measurement_unit')
+            .iterator()
+        )
+        keys = [entry[0] for entry in entries]
+        offsets = []
+        offset = 0
+        for key in keys:
+            offsets.append(offset)
+            offset += len(key) + 1
+        self._state = (
+            version,
+            keys,
+            [{'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+             for _, name, pk, measurement_unit in entries],
+            '\n'.join(keys),
+            offsets,
+        )
+
+    def _rebuild_in_thread(self, version):
+        try:
+            self.rebuild(version)
+        finally:
+            self._building = False
+            connection.close()
+
+
+ingredient_index = IngredientIndex()
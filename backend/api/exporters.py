@@ -0,0 +1,68 @@
+import csv
+import json
+
+EXPORT_CHUNK_SIZE = 500  # Количество строк в одном отправляемом блоке
+
+SHOPPING_LIST_HEADER = ('Foodgram представляет вам список ингридентов, '
+                        'необходимых для выбранных вами блюд:\n')
+SHOPPING_LIST_FOOTER = '\n\nСпасибо что воспользовались Foodgram!'
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def shopping_list_txt(ingredients):
+    yield SHOPPING_LIST_HEADER
+    for ingredient in ingredients:
+        name = ingredient['ingredient__name']
+        measurement_unit = ingredient['ingredient__measurement_unit']
+        amount = ingredient['full_amount']
+        yield f'\n{name} - {amount}, {measurement_unit}'
+    yield SHOPPING_LIST_FOOTER
+
+
+def shopping_list_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['full_amount'],
+        ))
+
+
+def shopping_list_json(ingredients):
+    yield '['
+    separator = ''
+    for ingredient in ingredients:
+        yield separator + json.dumps(
+            {
+                'name': ingredient['ingredient__name'],
+                'measurement_unit': ingredient['ingredient__measurement_unit'],
+                'amount': ingredient['full_amount'],
+            },
+            ensure_ascii=False,
+        )
+        separator = ', '
+    yield ']'
+
+
+SHOPPING_LIST_EXPORTERS = {
+    'txt': shopping_list_txt,
+    'csv': shopping_list_csv,
+    'json': shopping_list_json,
+}
+
+
+def stream_shopping_list(ingredients, export_format):
+    chunk = []
+    for line in SHOPPING_LIST_EXPORTERS[export_format](ingredients):
+        chunk.append(line)
+        if len(chunk) >= EXPORT_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
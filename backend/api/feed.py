@@ -0,0 +1,38 @@
+from collections import namedtuple
+from heapq import merge
+from itertools import islice
+
+from api.pagination import keyset_slice
+from recipes.models import Follow, Recipe, TimelineEntry
+
+FeedRow = namedtuple('FeedRow', 'pk updated_at author_id pub_date')
+
+
+def feed_rows(user_id, reverse, position, limit):
+    # Лента подписчика собирается из двух упорядоченных выборок по
+    # индексам: записей ленты, разосланных при публикации, и последних
+    # рецептов популярных авторов (recipes/timelines.py). Рецепт мог
+    # попасть в обе, пока автор не стал популярным.
+    parts = [keyset_slice(
+        TimelineEntry.objects.filter(user_id=user_id).values_list(
+            'recipe_id', 'recipe__updated_at', 'author_id', 'pub_date'
+        ),
+        reverse, position, limit, fields=('pub_date', 'recipe_id'),
+    )]
+    prolific = list(Follow.objects.filter(
+        user_id=user_id, author__is_prolific=True,
+    ).values_list('author_id', flat=True))
+    if prolific:
+        parts.append(keyset_slice(
+            Recipe.objects.filter(author_id__in=prolific).values_list(
+                'pk', 'updated_at', 'author_id', 'pub_date'
+            ),
+            reverse, position, limit,
+        ))
+    rows = merge(*(map(FeedRow._make, part) for part in parts),
+                 key=lambda row: (row.pub_date, row.pk),
+                 reverse=not reverse)
+    seen = set()
+    unique = (row for row in rows
+              if row.pk not in seen and not seen.add(row.pk))
+    return list(islice(unique, limit))
@@ -1,18 +1,50 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import (
+    BooleanField,
+    Case,
+    Exists,
+    F,
+    FloatField,
+    OuterRef,
+    Q,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast
 from django_filters.rest_framework import filters, FilterSet
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.rankings import RANKING_SCORE, RANKINGS
 
 User = get_user_model()
 
+SEARCH_CONFIG = 'russian'
+# Аннотация ранга поиска: по ней и id идёт сортировка и навигация по
+# ключу (api/pagination.py).
+SEARCH_RANK = 'rank'
+
 
 class IngredientFilter(FilterSet):
-    name = filters.CharFilter(lookup_expr='istartswith')
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ('name',)
 
+    def filter_name(self, queryset, name, value):
+        return (
+            queryset
+            .filter(name__icontains=value)
+            .annotate(is_prefix=Case(
+                When(name__istartswith=value, then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            ))
+            .order_by('-is_prefix', 'name')
+        )
+
 
 class RecipeFilter(FilterSet):
     is_favorited = filters.BooleanFilter(
@@ -29,19 +61,68 @@ class RecipeFilter(FilterSet):
         field_name='tags__slug',
         to_field_name='slug',
     )
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in RANKINGS],
+        method='filter_ordering',
+    )
 
     class Meta:
         model = Recipe
-        fields = ('is_favorited', 'is_in_shopping_cart', 'author', 'tags')
+        fields = ('is_favorited', 'is_in_shopping_cart', 'author', 'tags',
+                  'search', 'ordering')
 
     def filter_is_favorited(self, queryset, name, value):
-        user = self.request.user
-        if value and user.is_authenticated:
-            return queryset.filter(choice__user=user)
+        # Подзапрос, а не id__in по множеству из api.membership: у
+        # активного пользователя список в IN ничем не ограничен.
+        if value and self.request.user.is_authenticated:
+            return queryset.filter(Exists(Favorite.objects.filter(
+                user=self.request.user, recipe=OuterRef('pk'),
+            )))
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
-        user = self.request.user
-        if value and user.is_authenticated:
-            return queryset.filter(purchase__user=user)
+        if value and self.request.user.is_authenticated:
+            return queryset.filter(Exists(ShoppingCart.objects.filter(
+                user=self.request.user, recipe=OuterRef('pk'),
+            )))
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        if connection.vendor != 'postgresql':
+            # Без PostgreSQL (например, SQLite в тестах) — поиск подстроки,
+            # совпадения в названии выше совпадений в описании.
+            return (
+                queryset
+                .filter(Q(name__icontains=value) | Q(text__icontains=value))
+                .annotate(**{SEARCH_RANK: Case(
+                    When(name__icontains=value, then=Value(1.0)),
+                    default=Value(0.5),
+                    output_field=FloatField(),
+                )})
+                .order_by(f'-{SEARCH_RANK}', '-id')
+            )
+        query = SearchQuery(value, config=SEARCH_CONFIG,
+                            search_type='websearch')
+        return (
+            queryset
+            .filter(search_vector=query)
+            # ts_rank возвращает real: после приведения к double значение
+            # в курсоре совпадает с пересчитанным в условии.
+            .annotate(**{SEARCH_RANK: Cast(
+                SearchRank(F('search_vector'), query), FloatField(),
+            )})
+            .order_by(f'-{SEARCH_RANK}', '-id')
+        )
+
+    def filter_ordering(self, queryset, name, value):
+        # Сортировка по индексу таблицы оценок, без агрегатов по
+        # избранному и спискам покупок. Строка оценки есть у каждого
+        # рецепта (post_save, create_rankings для массовых вставок),
+        # поэтому внутреннее соединение никого не отбрасывает.
+        return (
+            queryset
+            .filter(ranking__isnull=False)
+            .annotate(**{RANKING_SCORE: F(f'ranking__{RANKINGS[value]}')})
+            .order_by(f'-{RANKING_SCORE}', '-id')
+        )
@@ -0,0 +1,135 @@
+import json
+import logging
+import random
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework.serializers import Serializer
+
+logger = logging.getLogger('api.timing')
+
+N_PLUS_ONE_THRESHOLD = 5  # Одинаковых запросов за один HTTP-запрос
+IN_LIST_RE = re.compile(r'\(%s(?:, %s)*\)')
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = defaultdict(float)
+        self.queries = 0
+        self.shapes = Counter()
+        self.shape_fields = defaultdict(Counter)
+
+    def add(self, name, duration):
+        self.durations[name] += duration
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add('db', time.perf_counter() - started)
+            self.queries += 1
+            shape = IN_LIST_RE.sub('(%s...)', sql)
+            self.shapes[shape] += 1
+            field = current_serializer_field()
+            if field is not None:
+                self.shape_fields[shape][field] += 1
+
+    def repeated_queries(self):
+        return [
+            {
+                'sql': shape,
+                'count': count,
+                'fields': dict(self.shape_fields[shape]),
+            }
+            for shape, count in self.shapes.items()
+            if count >= N_PLUS_ONE_THRESHOLD
+        ]
+
+    def server_timing(self):
+        total = time.perf_counter() - self.started
+        metrics = [f'db;dur={self.durations["db"] * 1000:.1f};'
+                   f'desc="{self.queries} queries"']
+        for name in ('serialize', 'render'):
+            if name in self.durations:
+                metrics.append(f'{name};dur={self.durations[name] * 1000:.1f}')
+        metrics.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(metrics)
+
+
+def current_serializer_field():
+    # Serializer.to_representation держит текущее поле в локальной
+    # переменной field: по ней видно, какое поле породило запрос.
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_code.co_name == 'to_representation':
+            serializer = frame.f_locals.get('self')
+            field = frame.f_locals.get('field')
+            if isinstance(serializer, Serializer) and field is not None:
+                return f'{type(serializer).__name__}.{field.field_name}'
+        frame = frame.f_back
+    return None
+
+
+def get_timings(request):
+    return getattr(request, 'timings', None)
+
+
+def instrument_connections(timings):
+    # Подключения к базе у каждого потока свои: замеры включаются в том
+    # потоке, где выполняются запросы.
+    stack = ExitStack()
+    for connection in connections.all():
+        if timings not in connection.execute_wrappers:
+            stack.enter_context(connection.execute_wrapper(timings))
+    return stack
+
+
+class ServerTimingMiddleware(MiddlewareMixin):
+    # Основан на MiddlewareMixin, чтобы под ASGI не переводить всю
+    # цепочку middleware в синхронный режим.
+
+    def process_request(self, request):
+        sample_rate = settings.REQUEST_TIMING_SAMPLE_RATE
+        if not sample_rate or random.random() >= sample_rate:
+            return
+        timings = RequestTimings()
+        request.timings = timings
+        timings.wrappers = instrument_connections(timings)
+
+    def process_response(self, request, response):
+        timings = get_timings(request)
+        if timings is None:
+            return response
+        timings.wrappers.close()
+
+        response['Server-Timing'] = timings.server_timing()
+        payload = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': timings.queries,
+            'durations_ms': {
+                name: round(duration * 1000, 1)
+                for name, duration in timings.durations.items()
+            },
+            'total_ms': round(
+                (time.perf_counter() - timings.started) * 1000, 1
+            ),
+        }
+        logger.info(json.dumps(payload, ensure_ascii=False))
+        repeated = timings.repeated_queries()
+        if repeated:
+            logger.warning(json.dumps(
+                {'method': request.method, 'path': request.path,
+                 'repeated_queries': repeated},
+                ensure_ascii=False,
+            ))
+        return response
@@ -0,0 +1,96 @@
+from array import array
+from uuid import uuid4
+
+from django.core.cache import cache
+
+from api import metrics
+from recipes.models import Favorite, Follow, ShoppingCart
+
+MEMBERSHIP_TIMEOUT = 60 * 60
+
+MEMBERSHIP_SOURCES = {
+    'favorites': (Favorite, 'recipe_id'),
+    'shopping_cart': (ShoppingCart, 'recipe_id'),
+    'follows': (Follow, 'author_id'),
+}
+
+
+def membership_key(user_id, kind):
+    return f'membership:{user_id}:{kind}'
+
+
+def version_key(user_id):
+    return f'membership:{user_id}:version'
+
+
+def pack(ids):
+    return array('q', sorted(ids)).tobytes()
+
+
+def unpack(packed):
+    ids = array('q')
+    ids.frombytes(packed)
+    return ids
+
+
+class Membership:
+    # Множества id рецептов в избранном и в списке покупок и id авторов
+    # в подписках одного пользователя. Загружаются из кеша одним
+    # get_many на запрос, при промахе — из базы.
+
+    def __init__(self, user):
+        self.user_id = user.id if user.is_authenticated else None
+        self._ids = None
+
+    def ids(self, kind):
+        if self._ids is None:
+            self._ids = self._load()
+        return self._ids[kind]
+
+    def contains(self, kind, pk):
+        return pk in self.ids(kind)
+
+    def _load(self):
+        # Множество хранится вместе с версией, при которой оно прочитано
+        # из базы, и годится, только пока версия пользователя та же.
+        # Запись удаляет версию, поэтому множество, которое параллельный
+        # запрос прочитал до записи и положил после неё, не используется.
+        if self.user_id is None:
+            return {kind: frozenset() for kind in MEMBERSHIP_SOURCES}
+        keys = {membership_key(self.user_id, kind): kind
+                for kind in MEMBERSHIP_SOURCES}
+        cached = cache.get_many([version_key(self.user_id), *keys])
+        version = cached.get(version_key(self.user_id))
+        if version is None:
+            version = uuid4().hex
+            if not cache.add(version_key(self.user_id), version, None):
+                version = cache.get(version_key(self.user_id), version)
+        loaded = {}
+        for key, kind in keys.items():
+            cached_version, packed = cached.get(key, (None, None))
+            if cached_version == version:
+                metrics.increment('membership.hits')
+                loaded[kind] = frozenset(unpack(packed))
+                continue
+            metrics.increment('membership.misses')
+            model, field = MEMBERSHIP_SOURCES[kind]
+            ids = model.objects.filter(
+                user_id=self.user_id
+            ).values_list(field, flat=True)
+            loaded[kind] = frozenset(ids)
+            cache.set(key, (version, pack(loaded[kind])), MEMBERSHIP_TIMEOUT)
+        return loaded
+
+
+def get_membership(request):
+    membership = getattr(request, '_membership', None)
+    if membership is None:
+        membership = Membership(request.user)
+        request._membership = membership
+    return membership
+
+
+def invalidate_membership(*user_ids):
+    # Вызывается после фиксации записи. Множества не читаются и не
+    # переписываются, поэтому параллельные записи не теряют изменений.
+    cache.delete_many([version_key(user_id) for user_id in user_ids])
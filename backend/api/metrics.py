@@ -0,0 +1,11 @@
+from collections import Counter
+
+counters = Counter()
+
+
+def increment(name, value=1):
+    counters[name] += value
+
+
+def snapshot():
+    return dict(sorted(counters.items()))
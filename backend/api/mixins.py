@@ -0,0 +1,174 @@
+import hashlib
+import time
+from functools import partial, wraps
+
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from api.instrumentation import get_timings
+from recipes.signals import get_version
+
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+class CachedListMixin:
+    # Список без параметров запроса кешируется целиком под ключом
+    # с номером версии; версия меняется сигналами при записи в модель.
+    cache_version_key = None
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params:
+            return super().list(request, *args, **kwargs)
+        version = get_version(self.cache_version_key)
+        cache_key = f'{self.cache_version_key}:{version}:list'
+        cached = cache.get(cache_key)
+        if cached is None:
+            data = super().list(request, *args, **kwargs).data
+            etag = '"{}"'.format(
+                hashlib.md5(JSONRenderer().render(data)).hexdigest()
+            )
+            cached = (etag, data)
+            cache.set(cache_key, cached, REFERENCE_CACHE_TIMEOUT)
+        etag, data = cached
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        return response
+
+
+class ConditionalGetMixin:
+    # ETag по отметке времени изменения. Если If-None-Match совпадает,
+    # 304 отдаётся после одного запроса ключевых полей по индексу, без
+    # загрузки связанных объектов и сериализации.
+    modified_field = 'updated_at'
+    etag_fields = ()
+
+    def get_etag_rows(self, rows):
+        # Переопределяется, если представление зависит от пользователя.
+        return list(rows)
+
+    def get_etag_queryset(self):
+        # Аннотации фильтров (ранг поиска, оценка сортировки) задают
+        # порядок: они входят в ETag и нужны курсору пагинации.
+        queryset = (
+            self.filter_queryset(self.get_queryset())
+            .prefetch_related(None)
+        )
+        return queryset.values_list(
+            'pk', self.modified_field, *self.etag_fields,
+            *queryset.query.annotations, named=True
+        )
+
+    def list(self, request, *args, **kwargs):
+        rows = self.get_etag_queryset()
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            rows = page
+        rows = list(rows)
+        etag = make_etag((self.get_etag_rows(rows), self.pagination_state()))
+        return self.conditional_response(
+            request, etag,
+            partial(self.list_response, request, rows, page is not None)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        row = (
+            self.get_etag_queryset()
+            .filter(**{self.lookup_field: lookup})
+            .first()
+        )
+        if row is None:
+            return super().retrieve(request, *args, **kwargs)
+        etag = make_etag(self.get_etag_rows([row]))
+        return self.conditional_response(
+            request, etag, partial(self.retrieve_response, request, row),
+            last_modified=getattr(row, self.modified_field)
+        )
+
+    def list_response(self, request, rows, paginated):
+        # Строки rows уже разбиты на страницы; переопределяется, чтобы
+        # собрать ответ по ним без повторной выборки.
+        return super().list(request)
+
+    def retrieve_response(self, request, row):
+        return super().retrieve(request)
+
+    def pagination_state(self):
+        paginator = self.paginator
+        if paginator is None:
+            return None
+        if getattr(paginator, 'cursor_mode', False):
+            return paginator.has_next, paginator.has_previous
+        return paginator.page.paginator.count
+
+    def conditional_response(self, request, etag, get_response,
+                             last_modified=None):
+        # Для анонимных пользователей представление зависит только от
+        # самого объекта, поэтому дата изменения достаточна.
+        if request.user.is_authenticated:
+            last_modified = None
+        if last_modified is not None:
+            last_modified = int(last_modified.timestamp())
+        if 'If-None-Match' in request.headers:
+            not_modified = etag in parse_etags(
+                request.headers['If-None-Match']
+            )
+        else:
+            since = parse_http_date_safe(
+                request.headers.get('If-Modified-Since', '')
+            )
+            not_modified = (last_modified is not None and since is not None
+                            and last_modified <= since)
+        if not_modified:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = get_response()
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
+
+
+def make_etag(parts):
+    return '"{}"'.format(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def timed(timings, name, function):
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timings.add(name, time.perf_counter() - started)
+    return wrapper
+
+
+class ServerTimingMixin:
+    # Добавляет время сериализации и рендеринга к замерам
+    # ServerTimingMiddleware, если запрос попал в выборку.
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        timings = get_timings(self.request)
+        if timings is not None:
+            serializer.to_representation = timed(
+                timings, 'serialize', serializer.to_representation
+            )
+        return serializer
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response,
+                                             *args, **kwargs)
+        timings = get_timings(request)
+        if timings is not None and hasattr(response, 'render'):
+            response.render = timed(timings, 'render', response.render)
+        return response
@@ -0,0 +1,135 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from functools import partial
+
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from api.filters import SEARCH_RANK
+from recipes.rankings import RANKING_SCORE
+
+
+def keyset_slice(queryset, reverse, position, limit,
+                 fields=('pub_date', 'id')):
+    # Порядок по убыванию (pub_date, id), при reverse — по возрастанию,
+    # начиная со строки, следующей за position.
+    date_field, pk_field = fields
+    if reverse:
+        queryset = queryset.order_by(date_field, pk_field)
+    else:
+        queryset = queryset.order_by(f'-{date_field}', f'-{pk_field}')
+    if position is not None:
+        pub_date, pk = position
+        after, seen = ('gte', 'lte') if reverse else ('lte', 'gte')
+        queryset = (
+            queryset.filter(**{f'{date_field}__{after}': pub_date})
+            .exclude(**{date_field: pub_date, f'{pk_field}__{seen}': pk})
+        )
+    return queryset[:limit]
+
+
+class RecipePagination(PageNumberPagination):
+    # По умолчанию постраничная навигация по номеру страницы.
+    # С параметром ?cursor= — навигация по ключу (pub_date, id),
+    # (оценка, id) при ?ordering= или (ранг, id) при ?search= без
+    # COUNT(*) и OFFSET.
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        fields = ('pub_date', 'id')
+        if RANKING_SCORE in queryset.query.annotations:
+            fields = (RANKING_SCORE, 'id')
+        elif SEARCH_RANK in queryset.query.annotations:
+            fields = (SEARCH_RANK, 'id')
+        return self.paginate_keyset(
+            partial(keyset_slice, queryset, fields=fields), request, fields
+        )
+
+    def paginate_keyset(self, fetch, request, fields=('pub_date', 'id')):
+        # fetch(reverse, position, limit) возвращает не больше limit
+        # объектов с pk и первым полем ключа, следующих за позицией
+        # курсора.
+        self.cursor_mode = True
+        self.request = request
+        self.keyset_field = fields[0]
+        page_size = self.get_page_size(request)
+        reverse, position = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param, '')
+        )
+        results = list(fetch(reverse, position, page_size + 1))
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        self.page_results = results
+        return results
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not self.has_next or not self.page_results:
+            return None
+        return self.build_cursor_link(self.page_results[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.cursor_mode:
+            return super().get_previous_link()
+        if not self.has_previous or not self.page_results:
+            return None
+        return self.build_cursor_link(self.page_results[0], reverse=True)
+
+    def build_cursor_link(self, recipe, reverse):
+        url = remove_query_param(self.request.build_absolute_uri(),
+                                 self.page_query_param)
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            self.encode_cursor(reverse, getattr(recipe, self.keyset_field),
+                               recipe.pk),
+        )
+
+    def encode_cursor(self, reverse, key, pk):
+        direction = 'p' if reverse else 'n'
+        if hasattr(key, 'isoformat'):
+            key = key.isoformat()
+        value = f'{direction}|{key!s}|{pk}'
+        return urlsafe_b64encode(value.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return False, None
+        try:
+            direction, key, pk = (
+                urlsafe_b64decode(cursor.encode()).decode().split('|')
+            )
+            if self.keyset_field == 'pub_date':
+                key = parse_datetime(key)
+            else:
+                key = float(key)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if direction not in ('n', 'p') or key is None:
+            raise NotFound(self.invalid_cursor_message)
+        return direction == 'p', (key, pk)
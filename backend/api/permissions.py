@@ -20,3 +20,9 @@ class IsOwnerOrAdminOrReadOnly(permissions.BasePermission):
         return (request.method in permissions.SAFE_METHODS
                 or request.user.role == User.Role.admin
                 or obj.author == request.user)
+
+
+class IsAdmin(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return (request.user.is_authenticated
+                and request.user.role == User.Role.admin)
@@ -0,0 +1,91 @@
+from functools import partial
+
+from django.db import connection, transaction
+
+from api.membership import invalidate_membership
+from recipes.counters import change_counters
+from recipes.models import Favorite, Follow, ShoppingCart
+from recipes.timelines import follow_changed
+
+# Связь пользователя с объектом: внешний ключ на рецепт или автора.
+RELATION_TARGETS = {
+    Favorite: 'recipe',
+    ShoppingCart: 'recipe',
+    Follow: 'author',
+}
+
+
+def relation_sql(model):
+    quote = connection.ops.quote_name
+    target = model._meta.get_field(RELATION_TARGETS[model])
+    return {
+        'table': quote(model._meta.db_table),
+        'user': quote(model._meta.get_field('user').column),
+        'target': quote(target.column),
+        'target_table': quote(target.related_model._meta.db_table),
+        'target_pk': quote(target.related_model._meta.pk.column),
+    }
+
+
+@transaction.atomic
+def add_relations(model, user_id, target_ids):
+    # Одна вставка без предварительной проверки: повтор или гонка двух
+    # запросов упираются в уникальное ограничение и ничего не меняют,
+    # несуществующие цели не вставляются. Возвращает id целей, для
+    # которых строка добавлена.
+    if not target_ids:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {table} ({user}, {target}) '
+            'SELECT %s, {target_pk} FROM {target_table} '
+            'WHERE {target_pk} IN ({targets}) '
+            'ON CONFLICT DO NOTHING RETURNING {target}'.format(
+                targets=', '.join(['%s'] * len(target_ids)),
+                **relation_sql(model),
+            ),
+            [user_id, *target_ids],
+        )
+        added = [target_id for target_id, in cursor.fetchall()]
+    relation_changed(model, user_id, added, 1)
+    return added
+
+
+@transaction.atomic
+def remove_relations(model, user_id, target_ids):
+    if not target_ids:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'DELETE FROM {table} WHERE {user} = %s '
+            'AND {target} IN ({targets}) RETURNING {target}'.format(
+                targets=', '.join(['%s'] * len(target_ids)),
+                **relation_sql(model),
+            ),
+            [user_id, *target_ids],
+        )
+        removed = [target_id for target_id, in cursor.fetchall()]
+    relation_changed(model, user_id, removed, -1)
+    return removed
+
+
+def add_relation(model, user_id, target_id):
+    # Возвращает True, если строка добавлена.
+    return bool(add_relations(model, user_id, [target_id]))
+
+
+def remove_relation(model, user_id, target_id):
+    return bool(remove_relations(model, user_id, [target_id]))
+
+
+def relation_changed(model, user_id, target_ids, delta):
+    # Запросы в обход ORM не вызывают сигналы.
+    if not target_ids:
+        return
+    field = f'{RELATION_TARGETS[model]}_id'
+    change_counters(model, [model(user_id=user_id, **{field: target_id})
+                            for target_id in target_ids], delta)
+    if model is Follow:
+        for target_id in target_ids:
+            follow_changed(user_id, target_id, delta)
+    transaction.on_commit(partial(invalidate_membership, user_id))
@@ -0,0 +1,63 @@
+import json
+
+from django.core.cache import cache
+
+from api import metrics
+from api.membership import get_membership
+
+REPRESENTATION_TIMEOUT = 60 * 60 * 24
+
+
+def representation_key(request, pk, updated_at):
+    # Ссылки на картинки абсолютные, поэтому в ключе есть схема и хост.
+    # Версия — дата изменения рецепта: её обновляют сигналы при записи
+    # рецепта, его тегов, ингредиентов и автора.
+    return (f'recipe:{request.scheme}:{request.get_host()}:{pk}:'
+            f'{updated_at.timestamp()}')
+
+
+def recipe_representations(view, rows):
+    # Общая для всех пользователей часть RecipeReadSerializer хранится
+    # в кеше готовым JSON. Строки rows — (pk, updated_at, author_id);
+    # рецепты загружаются и сериализуются только при промахе.
+    request = view.request
+    keys = [representation_key(request, row.pk, row.updated_at)
+            for row in rows]
+    cached = cache.get_many(keys)
+    metrics.increment('representation.hits', len(cached))
+    missing = [row.pk for row, key in zip(rows, keys) if key not in cached]
+    fresh = {}
+    if missing:
+        metrics.increment('representation.misses', len(missing))
+        recipes = list(view.get_queryset().filter(pk__in=missing))
+        serializer = view.get_serializer(recipes, many=True)
+        for recipe, data in zip(recipes, serializer.data):
+            fresh[recipe.pk] = data
+        cache.set_many(
+            {
+                representation_key(request, recipe.pk, recipe.updated_at):
+                    json.dumps(fresh[recipe.pk])
+                for recipe in recipes
+            },
+            REPRESENTATION_TIMEOUT,
+        )
+
+    membership = get_membership(request)
+    representations = []
+    for row, key in zip(rows, keys):
+        if key in cached:
+            data = json.loads(cached[key])
+        elif row.pk in fresh:
+            data = fresh[row.pk]
+        else:
+            # Рецепт удалён между выборкой строк и загрузкой.
+            continue
+        data['is_favorited'] = membership.contains('favorites', row.pk)
+        data['is_in_shopping_cart'] = membership.contains(
+            'shopping_cart', row.pk
+        )
+        data['author']['is_subscribed'] = membership.contains(
+            'follows', row.author_id
+        )
+        representations.append(data)
+    return representations
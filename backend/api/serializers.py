@@ -3,11 +3,12 @@ import base64
 from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
 from django.core.validators import EmailValidator
-from django.shortcuts import get_object_or_404
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
 from rest_framework.validators import UniqueValidator, UniqueTogetherValidator
 
+from recipes.images import content_hashed_name, variant_name
 from recipes.models import (
     Favorite,
     Follow,
@@ -19,10 +20,13 @@ from recipes.models import (
     Tag,
 )
 
-from api.validators import validate_username
+from api.membership import get_membership
+from api.validators import validate_recipes_limit, validate_username
 
 User = get_user_model()
 
+BULK_RECIPES_LIMIT = 100  # Рецептов в одном пакетном запросе
+
 
 class UserSerializer(serializers.ModelSerializer):
     username = serializers.CharField(
@@ -55,10 +59,9 @@ class UserSerializer(serializers.ModelSerializer):
         extra_kwargs = {'password': {'write_only': True}}
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if not user.is_authenticated:
-            return False
-        return obj.followed_by.filter(user=user).exists()
+        return get_membership(self.context['request']).contains(
+            'follows', obj.id
+        )
 
     def create(self, validated_data):
         user = User(
@@ -79,13 +82,6 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit')
 
 
-class IngredientLoadSerializer(serializers.ModelSerializer):
-
-    class Meta:
-        model = Ingredient
-        fields = ('name', 'measurement_unit')
-
-
 class TagSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -98,10 +94,38 @@ class Base64ImageField(serializers.ImageField):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            content = base64.b64decode(imgstr)
+            data = ContentFile(content,
+                               name=content_hashed_name(content, ext))
+            image = super().to_internal_value(data)
+            field = Recipe._meta.get_field('image')
+            name = field.generate_filename(None, data.name)
+            if field.storage.exists(name):
+                return name
+            return image
         return super().to_internal_value(data)
 
 
+class ImageVariantField(serializers.ReadOnlyField):
+    def __init__(self, variant, **kwargs):
+        self.variant = variant
+        kwargs['source'] = 'image'
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        name = variant_name(value.name, self.variant)
+        if value.storage.exists(name):
+            url = value.storage.url(name)
+        else:
+            url = value.url
+        request = self.context.get('request')
+        if request is None:
+            return url
+        return request.build_absolute_uri(url)
+
+
 class IngredientReadSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(source='ingredient.id', read_only=True)
     name = serializers.CharField(source='ingredient.name', read_only=True)
@@ -125,6 +149,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     is_favorited = SerializerMethodField()
     is_in_shopping_cart = SerializerMethodField()
     image = Base64ImageField()
+    image_thumb = ImageVariantField('thumb')
+    image_medium = ImageVariantField('medium')
 
     class Meta:
         model = Recipe
@@ -137,21 +163,21 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_thumb',
+            'image_medium',
             'text',
             'cooking_time',
         )
 
     def get_is_favorited(self, obj):
-        user = self.context['request'].user
-        if not user.is_authenticated:
-            return False
-        return obj.choice.filter(user=user).exists()
+        return get_membership(self.context['request']).contains(
+            'favorites', obj.id
+        )
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context['request'].user
-        if not user.is_authenticated:
-            return False
-        return obj.purchase.filter(user=user).exists()
+        return get_membership(self.context['request']).contains(
+            'shopping_cart', obj.id
+        )
 
 
 class IngredientWriteSerializer(serializers.ModelSerializer):
@@ -201,50 +227,71 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             )
         return data
 
+    def validate_ingredients(self, value):
+        ingredients = Ingredient.objects.in_bulk(
+            [ingredient['id'] for ingredient in value]
+        )
+        missing = sorted({ingredient['id'] for ingredient in value
+                          if ingredient['id'] not in ingredients})
+        if missing:
+            raise serializers.ValidationError(
+                'Ингредиенты не найдены: '
+                + ', '.join(str(pk) for pk in missing)
+            )
+        return value
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients_amounts')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
 
         recipe.tags.set(tags)
-        ingredient_list = []
-        for ingredient in ingredients:
-            current_ingredient = get_object_or_404(Ingredient,
-                                                   id=ingredient['id'])
-            amount = ingredient['amount']
-            ingredient_list.append(
-                IngredientRecipe(
-                    recipe=recipe,
-                    ingredient=current_ingredient,
-                    amount=amount,
-                )
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
+                recipe=recipe,
+                ingredient_id=ingredient['id'],
+                amount=ingredient['amount'],
             )
-        IngredientRecipe.objects.bulk_create(ingredient_list)
+            for ingredient in ingredients
+        )
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients_amounts')
         tags = validated_data.pop('tags')
-        instance.ingredients_amounts.all().delete()
 
         instance.tags.set(tags)
-        ingredient_list = []
+        current = {ingredient_amount.ingredient_id: ingredient_amount
+                   for ingredient_amount in instance.ingredients_amounts.all()}
+        to_create = []
+        to_update = []
         for ingredient in ingredients:
-            current_ingredient = get_object_or_404(Ingredient,
-                                                   id=ingredient['id'])
-            amount = ingredient['amount']
-            ingredient_list.append(
-                IngredientRecipe(
+            ingredient_amount = current.pop(ingredient['id'], None)
+            if ingredient_amount is None:
+                to_create.append(IngredientRecipe(
                     recipe=instance,
-                    ingredient=current_ingredient,
-                    amount=amount,
-                )
-            )
-        IngredientRecipe.objects.bulk_create(ingredient_list)
+                    ingredient_id=ingredient['id'],
+                    amount=ingredient['amount'],
+                ))
+            elif ingredient_amount.amount != ingredient['amount']:
+                ingredient_amount.amount = ingredient['amount']
+                to_update.append(ingredient_amount)
+        if current:
+            IngredientRecipe.objects.filter(
+                id__in=[ingredient_amount.id
+                        for ingredient_amount in current.values()]
+            ).delete()
+        if to_update:
+            IngredientRecipe.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            IngredientRecipe.objects.bulk_create(to_create)
         return super().update(instance, validated_data)
 
 
 class RecipeShortSerializer(serializers.ModelSerializer):
+    image_thumb = ImageVariantField('thumb')
 
     class Meta:
         model = Recipe
@@ -252,6 +299,7 @@ class RecipeShortSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_thumb',
             'cooking_time',
         )
 
@@ -298,10 +346,17 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         ).data
 
 
+class BulkRecipesSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_RECIPES_LIMIT,
+    )
+
+
 class SubscribeRepresentationSerializer(serializers.ModelSerializer):
     is_subscribed = SerializerMethodField()
     recipes = SerializerMethodField()
-    recipes_count = SerializerMethodField()
 
     class Meta:
         model = User
@@ -317,24 +372,25 @@ class SubscribeRepresentationSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if not user.is_authenticated:
-            return False
-        return obj.followed_by.filter(user=user).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return get_membership(self.context['request']).contains(
+            'follows', obj.id
+        )
 
     def get_recipes(self, obj):
         request = self.context['request']
-        recipes_limit = request.query_params.get('recipes_limit')
-        recipes_list = obj.recipes.all()
-        if recipes_limit:
-            recipes_list = recipes_list[:int(recipes_limit)]
+        if hasattr(obj, 'recipes_list'):
+            recipes_list = obj.recipes_list
+        else:
+            recipes_limit = validate_recipes_limit(
+                request.query_params.get('recipes_limit')
+            )
+            recipes_list = obj.recipes.all()[:recipes_limit]
         return RecipeShortSerializer(recipes_list, many=True,
                                      context={'request': request}
                                      ).data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
 class SubscribeSerializer(serializers.ModelSerializer):
 
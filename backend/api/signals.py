@@ -0,0 +1,55 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import token_cache
+from api.membership import invalidate_membership
+from recipes import cascades
+from recipes.models import Favorite, Follow, ShoppingCart
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+def membership_added(sender, instance, created, **kwargs):
+    if not created:
+        return
+    transaction.on_commit(partial(invalidate_membership, instance.user_id))
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Follow)
+def membership_removed(sender, instance, **kwargs):
+    if cascades.in_cascade(instance):
+        cascades.defer(invalidate_memberships, instance.user_id)
+    else:
+        transaction.on_commit(partial(invalidate_membership,
+                                      instance.user_id))
+
+
+def invalidate_memberships(user_ids):
+    transaction.on_commit(partial(invalidate_membership, *set(user_ids)))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(instance, **kwargs):
+    # Выход (djoser token destroy) и удаление пользователя.
+    transaction.on_commit(partial(token_cache.delete, instance.key))
+
+
+@receiver(post_save, sender=User)
+def user_saved(instance, created, **kwargs):
+    # Смена пароля, роли, деактивация и любые другие изменения
+    # пользователя сбрасывают снимок, чтобы он не устаревал.
+    if created:
+        return
+    keys = Token.objects.filter(user=instance).values_list('key', flat=True)
+    for key in keys:
+        transaction.on_commit(partial(token_cache.delete, key))
@@ -1,8 +1,11 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import SimpleRouter
 
+from api.async_views import async_read_urls
 from api.views import (
     IngredientViewSet,
+    MetricsViewSet,
     RecipeViewSet,
     TagViewSet,
     UserViewSet,
@@ -13,8 +16,13 @@ router_v1.register('ingredients', IngredientViewSet)
 router_v1.register('tags', TagViewSet)
 router_v1.register('recipes', RecipeViewSet)
 router_v1.register('users', UserViewSet)
+router_v1.register('metrics', MetricsViewSet, basename='metrics')
+
+router_urls = router_v1.urls
+if settings.ASYNC_READ_VIEWS:
+    router_urls = async_read_urls(router_urls)
 
 urlpatterns = [
-    path('', include(router_v1.urls)),
+    path('', include(router_urls)),
     path('auth/', include('djoser.urls.authtoken')),
 ]
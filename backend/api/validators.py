@@ -12,3 +12,13 @@ def validate_username(value):
         raise ValidationError(
             'В имени использованы недопустимые символы.'
         )
+
+
+def validate_recipes_limit(value):
+    if not value:
+        return None
+    if not value.isdigit() or int(value) < 1:
+        raise ValidationError(
+            {'recipes_limit': 'Укажите целое положительное число.'}
+        )
+    return int(value)
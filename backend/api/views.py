@@ -1,6 +1,15 @@
+from functools import partial
+
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import (
+    BooleanField,
+    OuterRef,
+    Prefetch,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from djoser.serializers import SetPasswordSerializer
 from django_filters.rest_framework import DjangoFilterBackend
@@ -8,14 +17,36 @@ from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
+from api import metrics
+from api.autocomplete import ingredient_index
+from api.exporters import EXPORT_CHUNK_SIZE, stream_shopping_list
+from api.feed import feed_rows
 from api.filters import IngredientFilter, RecipeFilter
+from api.membership import get_membership
+from api.mixins import (
+    CachedListMixin,
+    ConditionalGetMixin,
+    ServerTimingMixin,
+)
+from api.pagination import RecipePagination
 from api.permissions import (
+    IsAdmin,
     IsCurrentUserOrAdminOrReadOnly,
     IsOwnerOrAdminOrReadOnly,
 )
+from api.relations import (
+    add_relation,
+    add_relations,
+    remove_relation,
+    remove_relations,
+)
+from api.renderers import CSVRenderer, PlainTextRenderer
+from api.representations import recipe_representations
 from api.serializers import (
+    BulkRecipesSerializer,
     SubscribeSerializer,
     RecipeReadSerializer,
     RecipeWriteSerializer,
@@ -26,6 +57,7 @@ from api.serializers import (
     SubscribeRepresentationSerializer,
     UserSerializer,
 )
+from api.validators import validate_recipes_limit
 
 from recipes.models import (
     Favorite,
@@ -36,23 +68,56 @@ from recipes.models import (
     ShoppingCart,
     Tag,
 )
+from recipes.signals import INGREDIENTS_VERSION_KEY, TAGS_VERSION_KEY
 
 User = get_user_model()
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ServerTimingMixin, ConditionalGetMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
+    lookup_value_regex = r'\d+'
     http_method_names = ['get', 'post', 'patch', 'delete']
     permission_classes = (IsOwnerOrAdminOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
-    pagination_class = PageNumberPagination
+    pagination_class = RecipePagination
+    etag_fields = ('author_id', 'pub_date')
+
+    def get_queryset(self):
+        return (
+            Recipe.objects
+            .select_related('author')
+            .prefetch_related('tags', 'ingredients_amounts__ingredient')
+            .defer('search_vector')
+        )
 
     def get_serializer_class(self):
-        if self.action in ('list', 'retrieve',):
+        if self.action in ('list', 'retrieve', 'feed',):
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
+    def get_etag_rows(self, rows):
+        membership = get_membership(self.request)
+        return [
+            (row, membership.contains('favorites', row.pk),
+             membership.contains('shopping_cart', row.pk),
+             membership.contains('follows', row.author_id))
+            for row in rows
+        ]
+
+    def list_response(self, request, rows, paginated):
+        data = recipe_representations(self, rows)
+        if paginated:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def retrieve_response(self, request, row):
+        data = recipe_representations(self, [row])
+        if not data:
+            raise Http404
+        return Response(data[0])
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -61,67 +126,110 @@ class RecipeViewSet(viewsets.ModelViewSet):
             permission_classes=[IsAuthenticated, ],
             )
     def favorite(self, request, pk):
-        user = self.request.user
-        recipe = get_object_or_404(Recipe, id=pk)
+        return self.toggle(request, pk, Favorite, FavoriteSerializer,
+                           'Рецепт уже есть в избранном.',
+                           'Рецепта нет в избранном.')
+
+    @action(['post', 'delete'],
+            detail=True,
+            permission_classes=[IsAuthenticated, ],
+            )
+    def shopping_cart(self, request, pk):
+        return self.toggle(request, pk, ShoppingCart, ShoppingCartSerializer,
+                           'Рецепт уже есть в списке покупок',
+                           'Рецепта нет в списке покупок.')
 
+    def toggle(self, request, pk, model, serializer_class,
+               exists_message, missing_message):
+        # Один запрос на изменение: уникальное ограничение решает исход
+        # одновременных запросов, рецепт читается только для ответа.
+        user = request.user
+        pk = int(pk)
         if request.method == 'POST':
-            if Favorite.objects.filter(user=user, recipe=recipe).exists():
-                return Response({'errors': 'Рецепт уже есть в избранном.'},
+            added = add_relation(model, user.id, pk)
+            recipe = get_object_or_404(Recipe, id=pk)
+            if not added:
+                return Response({'errors': exists_message},
                                 status=status.HTTP_400_BAD_REQUEST,
                                 )
-            serializer = FavoriteSerializer(
-                data={'user': user.id, 'recipe': recipe.id},
+            serializer = serializer_class(
+                model(user=user, recipe=recipe),
                 context={'request': request},
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        if request.method == 'DELETE':
-            if not Favorite.objects.filter(user=user, recipe=recipe).exists():
-                return Response({'errors': 'Рецепта нет в избранном.'},
-                                status=status.HTTP_404_NOT_FOUND,
-                                )
-            Favorite.objects.filter(user=user, recipe=recipe).delete()
-            return Response('Рецепт успешно удалён из избранного.',
-                            status=status.HTTP_204_NO_CONTENT
+        if not remove_relation(model, user.id, pk):
+            get_object_or_404(Recipe, id=pk)
+            return Response({'errors': missing_message},
+                            status=status.HTTP_404_NOT_FOUND,
                             )
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(['post', 'delete'],
-            detail=True,
+            detail=False,
             permission_classes=[IsAuthenticated, ],
             )
-    def shopping_cart(self, request, pk):
-        user = self.request.user
-        recipe = get_object_or_404(Recipe, id=pk)
+    def bulk_favorite(self, request):
+        return self.bulk_change(request, Favorite)
 
-        if request.method == 'POST':
-            if ShoppingCart.objects.filter(user=user, recipe=recipe).exists():
-                return Response({'errors': 'Рецепт уже есть в списке покупок'},
-                                status=status.HTTP_400_BAD_REQUEST,
-                                )
-            serializer = ShoppingCartSerializer(
-                data={'user': user.id, 'recipe': recipe.id},
-                context={'request': request},
+    @action(['post', 'delete'],
+            detail=False,
+            permission_classes=[IsAuthenticated, ],
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+    def bulk_shopping_cart(self, request):
+        return self.bulk_change(request, ShoppingCart)
 
-        if request.method == 'DELETE':
-            if not ShoppingCart.objects.filter(user=user,
-                                               recipe=recipe).exists():
-                return Response({'errors': 'Рецепта нет в списке покупок.'},
-                                status=status.HTTP_404_NOT_FOUND,
-                                )
-            ShoppingCart.objects.filter(user=user, recipe=recipe).delete()
-            return Response('Рецепт успешно удалён из списка покупок.',
-                            status=status.HTTP_204_NO_CONTENT,
-                            )
+    def bulk_change(self, request, model):
+        # Пакетное добавление или удаление рецептов за постоянное число
+        # запросов. Статус «добавлен» или «удалён» получают только
+        # рецепты, которые вернула сама вставка или удаление, поэтому
+        # параллельные запросы не учитываются в счётчиках дважды.
+        serializer = BulkRecipesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = request.user
+        ids = list(dict.fromkeys(serializer.validated_data['recipes']))
+        found = set(
+            Recipe.objects.filter(id__in=ids).values_list('id', flat=True)
+        )
+        targets = [pk for pk in ids if pk in found]
+
+        if request.method == 'POST':
+            changed = add_relations(model, user.id, targets)
+            statuses = ('added', 'exists')
+        else:
+            changed = remove_relations(model, user.id, targets)
+            statuses = ('removed', 'absent')
+
+        changed = set(changed)
+        return Response({'results': [
+            {
+                'id': pk,
+                'status': (
+                    'not_found' if pk not in found
+                    else statuses[0] if pk in changed
+                    else statuses[1]
+                ),
+            }
+            for pk in ids
+        ]}, status=status.HTTP_200_OK)
+
+    @action(['get'],
+            detail=False,
+            permission_classes=[IsAuthenticated, ],
+            )
+    def feed(self, request):
+        # Рецепты авторов из подписок, только навигация по ключу.
+        rows = self.paginator.paginate_keyset(
+            partial(feed_rows, request.user.id), request
+        )
+        return self.paginator.get_paginated_response(
+            recipe_representations(self, rows)
+        )
 
     @action(['get'],
             detail=False,
             permission_classes=[IsAuthenticated, ],
+            renderer_classes=[PlainTextRenderer, CSVRenderer, JSONRenderer],
             )
     def download_shopping_cart(self, request):
         user = request.user
@@ -135,43 +243,53 @@ class RecipeViewSet(viewsets.ModelViewSet):
             .values('ingredient__name', 'ingredient__measurement_unit')
             .annotate(full_amount=Sum('amount'))
             .order_by('ingredient__name')
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE)
         )
-
-        shopping_list = 'Foodgram представляет вам список ингридентов, '
-        shopping_list += 'необходимых для выбранных вами блюд:\n'
-        for ingredient in ingredients:
-            name = ingredient['ingredient__name']
-            measurement_unit = ingredient['ingredient__measurement_unit']
-            amount = ingredient['full_amount']
-            shopping_list += f'\n{name} - {amount}, {measurement_unit}'
-        shopping_list += '\n\nСпасибо что воспользовались Foodgram!'
-        filename = 'shopping_cart.txt'
-        response = HttpResponse(shopping_list, content_type='text/plain')
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            stream_shopping_list(ingredients, renderer.format),
+            content_type=f'{renderer.media_type}; charset=utf-8',
+        )
+        filename = f'shopping_cart.{renderer.format}'
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(ServerTimingMixin, CachedListMixin,
+                 viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
+    cache_version_key = TAGS_VERSION_KEY
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ServerTimingMixin, CachedListMixin,
+                        viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
     filter_backends = (DjangoFilterBackend, )
     filterset_class = IngredientFilter
     pagination_class = None
+    cache_version_key = INGREDIENTS_VERSION_KEY
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            ingredients = ingredient_index.search(name)
+            if ingredients is not None:
+                return Response(ingredients)
+        return super().list(request, *args, **kwargs)
 
-class UserViewSet(mixins.CreateModelMixin,
+
+class UserViewSet(ServerTimingMixin,
+                  mixins.CreateModelMixin,
                   mixins.RetrieveModelMixin,
                   mixins.ListModelMixin,
                   viewsets.GenericViewSet):
     queryset = User.objects.all()
+    lookup_value_regex = r'\d+'
     serializer_class = UserSerializer
     permission_classes = (IsCurrentUserOrAdminOrReadOnly,)
     pagination_class = PageNumberPagination
@@ -179,6 +297,8 @@ class UserViewSet(mixins.CreateModelMixin,
     def get_serializer_class(self):
         if self.action == "set_password":
             return SetPasswordSerializer
+        if self.action == "subscriptions":
+            return SubscribeRepresentationSerializer
         return UserSerializer
 
     @action(['get'], detail=False)
@@ -192,12 +312,12 @@ class UserViewSet(mixins.CreateModelMixin,
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
+        # request.user — снимок из кеша токенов, его счётчики и флаги
+        # могли устареть: записывается только пароль.
         self.request.user.set_password(serializer.data["new_password"])
-        self.request.user.save()
+        self.request.user.save(update_fields=['password'])
 
-        return Response('Пароль упешно изменен.',
-                        status=status.HTTP_204_NO_CONTENT,
-                        )
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(['post', 'delete'],
             detail=True,
@@ -205,30 +325,33 @@ class UserViewSet(mixins.CreateModelMixin,
             )
     def subscribe(self, request, pk):
         user = self.request.user
-        author = get_object_or_404(User, id=pk)
+        pk = int(pk)
 
         if request.method == 'POST':
-            if Follow.objects.filter(user=user, author=author).exists():
+            if pk == user.id:
+                return Response(
+                    {'errors': 'Нельзя оформить подписку на самого себя!'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            added = add_relation(Follow, user.id, pk)
+            author = get_object_or_404(User, id=pk)
+            if not added:
                 return Response({'errors': 'Такая подписка уже есть.'},
                                 status=status.HTTP_400_BAD_REQUEST,
                                 )
             serializer = SubscribeSerializer(
-                data={'user': user.id, 'author': author.id},
+                Follow(user=user, author=author),
                 context={'request': request},
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            if not Follow.objects.filter(user=user, author=author).exists():
+            if not remove_relation(Follow, user.id, pk):
+                get_object_or_404(User, id=pk)
                 return Response({'errors': 'Объект не найден.'},
                                 status=status.HTTP_404_NOT_FOUND,
                                 )
-            Follow.objects.filter(user=user, author=author).delete()
-            return Response('Успешная отписка.',
-                            status=status.HTTP_204_NO_CONTENT
-                            )
+            return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(['get'],
             detail=False,
@@ -236,18 +359,38 @@ class UserViewSet(mixins.CreateModelMixin,
             )
     def subscriptions(self, request):
         user = self.request.user
-        authors = User.objects.filter(followed_by__user=user).all()
+        recipes_limit = validate_recipes_limit(
+            request.query_params.get('recipes_limit')
+        )
+        recipes = Recipe.objects.defer('search_vector').order_by('-pub_date')
+        if recipes_limit is not None:
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects
+                .filter(author=OuterRef('author'))
+                .order_by('-pub_date')
+                .values('pk')[:recipes_limit]
+            ))
+        authors = (
+            User.objects
+            .filter(followed_by__user=user)
+            .annotate(
+                is_subscribed=Value(True, output_field=BooleanField()),
+            )
+            .order_by('id')
+            .prefetch_related(
+                Prefetch('recipes', queryset=recipes, to_attr='recipes_list')
+            )
+        )
         page = self.paginate_queryset(authors)
         if page is not None:
-            serializer = SubscribeRepresentationSerializer(
-                page,
-                many=True,
-                context={'request': request},
-            )
+            serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
-        serializer = SubscribeRepresentationSerializer(
-            authors,
-            many=True,
-            context={'request': request},
-        )
+        serializer = self.get_serializer(authors, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class MetricsViewSet(viewsets.ViewSet):
+    permission_classes = (IsAdmin,)
+
+    def list(self, request):
+        return Response(metrics.snapshot())
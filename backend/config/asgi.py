@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+# То же, что get_asgi_application(), но с обработчиком, который читает
+# потоковые ответы вне цикла событий.
+django.setup(set_prefix=False)
+
+from api.async_views import StreamingASGIHandler  # noqa: E402
+
+application = StreamingASGIHandler()
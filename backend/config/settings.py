@@ -13,6 +13,8 @@ import os
 from dotenv import load_dotenv
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -21,6 +23,10 @@ SECRET_KEY = os.getenv('SECRET_KEY')
 
 DEBUG = os.getenv('DEBUG', 'false').lower() == 'true'
 
+# Асинхронные представления для чтения при запуске под ASGI
+# (make run_uvicorn).
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'false').lower() == 'true'
+
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS').split(', ')
 
 PROJECT_APPS = [
@@ -43,6 +49,7 @@ INSTALLED_APPS = [
 ] + PROJECT_APPS
 
 MIDDLEWARE = [
+    'api.instrumentation.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,6 +94,24 @@ DATABASES = {
     }
 }
 
+# Кеш должен быть общим для всех процессов: версии списков тегов и
+# ингредиентов меняют и команды manage.py (load_ingredients,
+# generate_dataset), а множества избранного и подписок — все воркеры.
+# LocMemCache у каждого процесса свой, его можно указать явно только
+# для разработки в одном процессе.
+if not os.getenv('CACHE_BACKEND'):
+    raise ImproperlyConfigured(
+        'Не задан CACHE_BACKEND: нужен общий кеш, например '
+        'django.core.cache.backends.memcached.PyMemcacheCache.'
+    )
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -143,7 +168,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 
     # 'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
@@ -153,3 +178,26 @@ REST_FRAMEWORK = {
 DJOSER = {
     'LOGIN_FIELD': 'email',
 }
+
+# Доля запросов, для которых считаются SQL-запросы и время этапов
+# обработки (заголовок Server-Timing и журнал api.timing).
+REQUEST_TIMING_SAMPLE_RATE = float(
+    os.getenv('REQUEST_TIMING_SAMPLE_RATE', '0')
+)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -1,4 +1,7 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 
 from recipes.models import (
     Favorite,
@@ -12,58 +15,91 @@ from recipes.models import (
 )
 
 EMPTY_VALUE = '--NONE--'
+ESTIMATED_COUNT_THRESHOLD = 100000
+
+
+class EstimatedCountPaginator(Paginator):
+    # Для больших таблиц без фильтров PostgreSQL хранит оценку числа
+    # строк в pg_class: она заменяет COUNT(*) по всей таблице.
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class '
+                    'WHERE relname = %s',
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= ESTIMATED_COUNT_THRESHOLD:
+                return row[0]
+        return super().count
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    empty_value_display = EMPTY_VALUE
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(ScalableAdmin):
     list_display = ('pk', 'user', 'recipe')
-    search_fields = ('user', 'recipe')
-    empty_value_display = EMPTY_VALUE
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'recipe__name')
+    autocomplete_fields = ('user', 'recipe')
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(ScalableAdmin):
     list_display = ('pk', 'user', 'author')
-    search_fields = ('user', 'author')
-    empty_value_display = EMPTY_VALUE
+    list_select_related = ('user', 'author')
+    search_fields = ('user__username', 'author__username')
+    autocomplete_fields = ('user', 'author')
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(ScalableAdmin):
     list_display = ('pk', 'name', 'measurement_unit')
     search_fields = ('name',)
-    list_filter = ('name',)
-    empty_value_display = EMPTY_VALUE
+    list_filter = ('measurement_unit',)
+    ordering = ('name',)
 
 
 class IngredientRecipeInline(admin.TabularInline):
     model = IngredientRecipe
+    autocomplete_fields = ('ingredient',)
+    extra = 1
 
 
 @admin.register(IngredientRecipe)
-class IngredientRecipeAdmin(admin.ModelAdmin):
+class IngredientRecipeAdmin(ScalableAdmin):
     list_display = ('pk', 'ingredient', 'recipe', 'amount')
-    search_fields = ('ingredient', 'recipe')
-    empty_value_display = EMPTY_VALUE
+    list_select_related = ('ingredient', 'recipe')
+    search_fields = ('ingredient__name', 'recipe__name')
+    autocomplete_fields = ('ingredient', 'recipe')
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(ScalableAdmin):
     inlines = (IngredientRecipeInline, )
-    list_display = ('pk', 'name', 'author', 'favorites_count')
-    search_fields = ('name', 'author')
-    list_filter = ('name', 'author', 'tags')
-    empty_value_display = EMPTY_VALUE
-
-    def favorites_count(self, instance):
-        return instance.choice.count()
+    list_display = ('pk', 'name', 'author', 'favorites_count',
+                    'shopping_cart_count')
+    list_select_related = ('author',)
+    search_fields = ('name', 'author__username')
+    list_filter = ('tags',)
+    autocomplete_fields = ('author',)
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(ScalableAdmin):
     list_display = ('pk', 'user', 'recipe')
-    search_fields = ('user', 'recipe')
-    empty_value_display = EMPTY_VALUE
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'recipe__name')
+    autocomplete_fields = ('user', 'recipe')
 
 
 @admin.register(Tag)
@@ -75,7 +111,8 @@ class TagAdmin(admin.ModelAdmin):
 
 
 @admin.register(TagRecipe)
-class TagRecipeAdmin(admin.ModelAdmin):
+class TagRecipeAdmin(ScalableAdmin):
     list_display = ('pk', 'tag', 'recipe')
-    search_fields = ('tag', 'recipe')
-    empty_value_display = EMPTY_VALUE
+    list_select_related = ('tag', 'recipe')
+    search_fields = ('tag__name', 'recipe__name')
+    autocomplete_fields = ('tag', 'recipe')
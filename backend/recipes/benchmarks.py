@@ -0,0 +1,10 @@
+class Rollback(Exception):
+    pass
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    if not ordered:
+        return 0
+    index = min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))
+    return ordered[index]
@@ -0,0 +1,69 @@
+from threading import local
+
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished
+from django.dispatch import receiver
+
+from recipes.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+# Внешние ключи, по которым строка удаляется каскадом вместе с
+# родителем.
+PARENT_FIELDS = {
+    'recipe_id': Recipe,
+    'user_id': User,
+    'author_id': User,
+    'tag_id': Tag,
+    'ingredient_id': Ingredient,
+}
+
+
+class CascadeState(local):
+    # Родители, удаляемые в текущем потоке (от pre_delete до post_delete
+    # родителя), и отложенные до конца удаления вызовы.
+
+    def __init__(self):
+        self.deleting = {}
+        self.deferred = {}
+
+
+state = CascadeState()
+
+
+def start(instance):
+    model = instance._meta.concrete_model
+    state.deleting.setdefault(model, set()).add(instance.pk)
+
+
+def finish(instance):
+    # Django удаляет родителя после всех зависимых строк, поэтому к его
+    # post_delete отложенные вызовы уже собраны.
+    deferred, state.deferred = state.deferred, {}
+    for function, items in deferred.items():
+        function(items)
+    state.deleting.get(instance._meta.concrete_model, set()).discard(
+        instance.pk
+    )
+
+
+def is_deleting(model, pk):
+    return pk in state.deleting.get(model, ())
+
+
+def in_cascade(instance):
+    return any(is_deleting(model, getattr(instance, field, None))
+               for field, model in PARENT_FIELDS.items())
+
+
+def defer(function, item):
+    # Вместо запроса на каждую удаляемую каскадом строку — один вызов
+    # function со списком всех строк в конце удаления родителя.
+    state.deferred.setdefault(function, []).append(item)
+
+
+@receiver(request_finished)
+def reset(**kwargs):
+    # Если удаление прервалось ошибкой, post_delete родителя не
+    # наступил: отметка не должна пережить запрос.
+    state.__init__()
@@ -0,0 +1,95 @@
+from collections import Counter, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.cascades import is_deleting
+from recipes.models import Favorite, Follow, Recipe, ShoppingCart
+
+User = get_user_model()
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Денормализованные счётчики: (модель, поле счётчика, модель связи,
+# внешний ключ связи на модель).
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'shopping_cart_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+
+
+def change_counter(model, field, pks, delta):
+    # Атомарное изменение на стороне базы, без чтения значения.
+    # Разошедшийся счётчик не уходит в минус, его исправит
+    # reconcile_counters.
+    value = F(field) + delta
+    if delta < 0:
+        value = Greatest(value, 0)
+    return model.objects.filter(pk__in=pks).update(**{field: value})
+
+
+def change_counters(relation, instances, delta):
+    for model, field, source, key in COUNTERS:
+        if source is not relation:
+            continue
+        # Один UPDATE на каждое различное число строк с той же целью.
+        # Счётчики удаляемых рецептов и пользователей не меняются.
+        targets = defaultdict(list)
+        for pk, count in Counter(getattr(instance, f'{key}_id')
+                                 for instance in instances).items():
+            if not is_deleting(model, pk):
+                targets[count].append(pk)
+        for count, pks in targets.items():
+            change_counter(model, field, pks, delta * count)
+
+
+def actual_count(relation, key):
+    return Coalesce(Subquery(
+        relation.objects
+        .filter(**{key: OuterRef('pk')})
+        .order_by()
+        .values(key)
+        .annotate(count=Count('pk'))
+        .values('count')
+    ), 0)
+
+
+def reconcile_counter(model, field, relation, key,
+                      batch_size=DEFAULT_BATCH_SIZE):
+    # Проходит по таблице пачками по первичному ключу и пересчитывает
+    # только разошедшиеся значения. Возвращает число исправленных строк.
+    repaired = 0
+    last_pk = 0
+    while True:
+        pks = list(
+            model.objects
+            .filter(pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            return repaired
+        drifted = list(
+            model.objects
+            .filter(pk__gt=last_pk, pk__lte=pks[-1])
+            .annotate(actual=actual_count(relation, key))
+            .exclude(**{field: F('actual')})
+            .values_list('pk', flat=True)
+        )
+        if drifted:
+            repaired += model.objects.filter(pk__in=drifted).update(
+                **{field: actual_count(relation, key)}
+            )
+        last_pk = pks[-1]
+
+
+def reconcile_counters(batch_size=DEFAULT_BATCH_SIZE):
+    return {
+        f'{model._meta.model_name}.{field}': reconcile_counter(
+            model, field, relation, key, batch_size
+        )
+        for model, field, relation, key in COUNTERS
+    }
@@ -0,0 +1,60 @@
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+IMAGE_VARIANTS = {
+    'thumb': (360, 360),
+    'medium': (720, 720),
+}
+VARIANTS_DIR = 'recipes/images/variants/'
+WEBP_QUALITY = 80
+
+executor = ThreadPoolExecutor(max_workers=1,
+                              thread_name_prefix='image-variants')
+
+
+def content_hashed_name(content, ext):
+    return f'{hashlib.sha256(content).hexdigest()[:32]}.{ext}'
+
+
+def variant_name(name, variant):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return f'{VARIANTS_DIR}{stem}_{variant}.webp'
+
+
+def generate_variants(storage, name):
+    targets = {variant: variant_name(name, variant)
+               for variant in IMAGE_VARIANTS}
+    missing = {variant: target for variant, target in targets.items()
+               if not storage.exists(target)}
+    if not missing:
+        return False
+    with storage.open(name) as source, Image.open(source) as image:
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        for variant, target in missing.items():
+            resized = image.copy()
+            resized.thumbnail(IMAGE_VARIANTS[variant])
+            buffer = BytesIO()
+            resized.save(buffer, 'WEBP', quality=WEBP_QUALITY)
+            storage.save(target, ContentFile(buffer.getvalue()))
+    return True
+
+
+def _generate_in_worker(storage, name, on_ready):
+    try:
+        if generate_variants(storage, name) and on_ready is not None:
+            on_ready(name)
+    except Exception:
+        logger.exception('Не удалось подготовить варианты %s', name)
+
+
+def schedule_variants(storage, name, on_ready=None):
+    executor.submit(_generate_in_worker, storage, name, on_ready)
@@ -0,0 +1,327 @@
+import json
+import re
+
+from django.apps import apps
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import connection, migrations, models
+from django.db.migrations.loader import MigrationLoader
+
+PROJECT_APPS = ('recipes', 'users')
+MIN_ROWS = 1000  # Таблицы меньше дешевле читать целиком
+EXPLAIN_ANALYZE = 'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) '
+EXPLAIN = 'EXPLAIN (FORMAT JSON) '
+
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+COLUMN_RE = re.compile(r'(?:\b([A-Za-z_]\w*)\.)?\b([A-Za-z_]\w*)\b')
+UPPER_RE = re.compile(r'upper\(\(?([A-Za-z_][A-Za-z0-9_]*)')
+SORT_KEY_RE = re.compile(
+    r'^(?:\(?([A-Za-z_][A-Za-z0-9_]*)\.)?([A-Za-z_][A-Za-z0-9_]*)\)?'
+    r'(\s+DESC)?'
+)
+JOIN_CONDITIONS = ('Hash Cond', 'Merge Cond', 'Join Filter', 'Index Cond')
+
+
+def explain(sql, params, analyze=True):
+    with connection.cursor() as cursor:
+        cursor.execute((EXPLAIN_ANALYZE if analyze else EXPLAIN) + sql,
+                       params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
+
+
+def iter_nodes(node, ancestors=()):
+    yield node, ancestors
+    for child in node.get('Plans', ()):
+        yield from iter_nodes(child, ancestors + (node,))
+
+
+def node_time(node):
+    # Собственное время узла без дочерних, мс.
+    def total(item):
+        return item.get('Actual Total Time', 0) * item.get('Actual Loops', 1)
+    return max(total(node) - sum(total(child)
+                                 for child in node.get('Plans', ())), 0)
+
+
+def node_rows(node):
+    loops = node.get('Actual Loops', 1)
+    return (node.get('Actual Rows', 0)
+            + node.get('Rows Removed by Filter', 0)) * loops
+
+
+def project_tables():
+    return {
+        model._meta.db_table: model
+        for app_label in PROJECT_APPS
+        for model in apps.get_app_config(app_label).get_models()
+    }
+
+
+def field_names(model):
+    return {field.column: field.name
+            for field in model._meta.concrete_fields}
+
+
+class Proposal:
+    # Индекс для одной модели: btree по полям (с '-' для убывания),
+    # триграммный GIN по полю или по UPPER(поле) для LIKE/ILIKE.
+
+    def __init__(self, model, fields, kind='btree'):
+        self.model = model
+        self.fields = tuple(fields)
+        self.kind = kind
+        self.queries = {}
+
+    @property
+    def key(self):
+        return self.model._meta.label, self.fields, self.kind
+
+    @property
+    def columns(self):
+        return [self.model._meta.get_field(field.lstrip('-')).column
+                for field in self.fields]
+
+    def describe(self):
+        fields = ', '.join(self.fields)
+        if self.kind == 'btree':
+            return f'{self.model.__name__}({fields})'
+        if self.kind == 'upper_trigram':
+            fields = f'UPPER({fields})'
+        return f'{self.model.__name__}({fields}) gin_trgm_ops'
+
+    def index(self):
+        if self.kind == 'trigram':
+            # Имя нужно для opclasses, его заменит set_name_with_model.
+            index = GinIndex(fields=list(self.fields),
+                             opclasses=['gin_trgm_ops'], name='advised')
+        else:
+            index = models.Index(fields=list(self.fields), name='')
+        index.set_name_with_model(self.model)
+        return index
+
+    def upper_index_name(self):
+        return f'{self.model._meta.db_table}_{self.columns[0]}_upper_trgm'
+
+    def create_sql(self):
+        if self.kind == 'upper_trigram':
+            quote = connection.ops.quote_name
+            return (f'CREATE INDEX {quote(self.upper_index_name())} ON '
+                    f'{quote(self.model._meta.db_table)} USING gin '
+                    f'(UPPER({quote(self.columns[0])}) gin_trgm_ops)')
+        editor = connection.schema_editor(collect_sql=True)
+        return str(self.index().create_sql(self.model, editor))
+
+    def operations(self):
+        if self.kind == 'upper_trigram':
+            quote = connection.ops.quote_name
+            return [migrations.RunSQL(
+                self.create_sql(),
+                f'DROP INDEX {quote(self.upper_index_name())}',
+            )]
+        return [migrations.AddIndex(model_name=self.model._meta.model_name,
+                                    index=self.index())]
+
+    def is_covered(self):
+        # Существующий индекс с теми же первыми столбцами уже даёт
+        # и фильтр, и порядок.
+        table = self.model._meta.db_table
+        with connection.cursor() as cursor:
+            if self.kind != 'btree':
+                cursor.execute(
+                    'SELECT indexdef FROM pg_indexes WHERE tablename = %s',
+                    [table],
+                )
+                return any(
+                    'gin_trgm_ops' in definition
+                    and self.columns[0] in definition
+                    and (self.kind == 'trigram')
+                    == ('upper(' not in definition.lower())
+                    for definition, in cursor.fetchall()
+                )
+            constraints = connection.introspection.get_constraints(cursor,
+                                                                   table)
+        columns = self.columns
+        return any(
+            (constraint['index'] or constraint['unique']
+             or constraint['primary_key'])
+            and constraint['columns'][:len(columns)] == columns
+            for constraint in constraints.values()
+        )
+
+
+def condition_columns(text, alias, columns):
+    # Столбцы таблицы alias, упомянутые в условии узла плана.
+    text = LITERAL_RE.sub('', text or '')
+    found = []
+    for qualifier, column in COLUMN_RE.findall(text):
+        if (qualifier in ('', alias) and column in columns
+                and column not in found):
+            found.append(column)
+    return found
+
+
+def sort_fields(node, alias, columns):
+    # Поля ключа сортировки, если все они из таблицы alias.
+    fields = []
+    for key in node.get('Sort Key', ()):
+        match = SORT_KEY_RE.match(key)
+        if match is None:
+            return []
+        key_alias, column, descending = match.groups()
+        if key_alias not in (None, alias) or column not in columns:
+            return []
+        fields.append(('-' if descending else '') + columns[column])
+    return fields
+
+
+def analyze_plan(plan, tables):
+    # Находит последовательные чтения больших таблиц и сортировки и
+    # предлагает для них индексы. Возвращает список
+    # (описание проблемы, время узла в мс, Proposal или None).
+    findings = []
+    aliases = {}
+    for node, _ in iter_nodes(plan['Plan']):
+        if 'Relation Name' in node:
+            aliases[node.get('Alias', node['Relation Name'])] = (
+                node['Relation Name']
+            )
+    for node, ancestors in iter_nodes(plan['Plan']):
+        node_type = node['Node Type']
+        if node_type == 'Seq Scan' and node_rows(node) >= MIN_ROWS:
+            findings.append(seq_scan_finding(node, ancestors, tables))
+        elif node_type in ('Sort', 'Incremental Sort') and (
+                node_rows(node) >= MIN_ROWS
+                or node.get('Sort Space Type') == 'Disk'):
+            findings.append(sort_finding(node, aliases, tables))
+    return findings
+
+
+def seq_scan_finding(node, ancestors, tables):
+    table = node['Relation Name']
+    alias = node.get('Alias', table)
+    problem = (f'Seq Scan {table}: прочитано {node_rows(node)} строк, '
+               f'отброшено {node.get("Rows Removed by Filter", 0)}')
+    model = tables.get(table)
+    if model is None:
+        return problem, node_time(node), None
+    columns = field_names(model)
+    text = node.get('Filter', '')
+    if '~~' in text:
+        upper = [column for column in UPPER_RE.findall(text)
+                 if column in columns]
+        if upper:
+            return problem, node_time(node), Proposal(
+                model, [columns[upper[0]]], 'upper_trigram'
+            )
+        pattern = condition_columns(text, alias, columns)
+        if pattern:
+            return problem, node_time(node), Proposal(
+                model, [columns[pattern[0]]], 'trigram'
+            )
+    filtered = condition_columns(text, alias, columns)
+    if not filtered:
+        # Таблица читается целиком для соединения: индекс по столбцу
+        # из условия соединения.
+        for ancestor in reversed(ancestors):
+            for condition in JOIN_CONDITIONS:
+                filtered = condition_columns(
+                    qualified_only(ancestor.get(condition, ''), alias),
+                    alias, columns,
+                )
+                if filtered:
+                    break
+            if filtered:
+                break
+    if not filtered:
+        return problem, node_time(node), None
+    fields = [columns[column] for column in filtered]
+    for ancestor in reversed(ancestors):
+        if ancestor['Node Type'] in ('Sort', 'Incremental Sort'):
+            fields += [field for field in sort_fields(ancestor, alias,
+                                                      columns)
+                       if field.lstrip('-') not in fields]
+            break
+    return problem, node_time(node), Proposal(model, fields)
+
+
+def sort_finding(node, aliases, tables):
+    keys = ', '.join(node.get('Sort Key', ()))
+    problem = (f'Sort ({keys}): {node.get("Actual Rows", 0)} строк, '
+               f'{node.get("Sort Method", "")} '
+               f'{node.get("Sort Space Used", 0)} kB '
+               f'{node.get("Sort Space Type", "")}').rstrip()
+    for alias, table in aliases.items():
+        model = tables.get(table)
+        if model is None:
+            continue
+        fields = sort_fields(node, alias, field_names(model))
+        if fields:
+            return problem, node_time(node), Proposal(model, fields)
+    return problem, node_time(node), None
+
+
+def qualified_only(text, alias):
+    # Из условия соединения оставляет только ссылки вида alias.column.
+    return ' '.join(re.findall(rf'\b{re.escape(alias)}\.[A-Za-z_]\w*', text))
+
+
+def hypothetical_cost(sql, params, proposal):
+    # Стоимость плана с гипотетическим индексом расширения hypopg:
+    # индекс не строится и не блокирует таблицу. hypopg поддерживает
+    # только btree.
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT * FROM hypopg_create_index(%s)',
+                       [proposal.create_sql()])
+        try:
+            return explain(sql, params, analyze=False)['Plan']['Total Cost']
+        finally:
+            cursor.execute('SELECT hypopg_reset()')
+
+
+def measured_time(sql, params, proposal):
+    # Строит индекс внутри транзакции, которую вызывающий откатывает.
+    with connection.cursor() as cursor:
+        cursor.execute('SAVEPOINT advised_index')
+        if proposal.kind != 'btree':
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        cursor.execute(proposal.create_sql())
+    try:
+        return explain(sql, params)['Execution Time']
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('ROLLBACK TO SAVEPOINT advised_index')
+
+
+def has_hypopg():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_extension WHERE extname = 'hypopg'"
+        )
+        return cursor.fetchone() is not None
+
+
+def build_migrations(proposals):
+    # Миграции с предложенными индексами по приложениям, номер —
+    # следующий за последней миграцией приложения.
+    loader = MigrationLoader(connection, ignore_no_migrations=True)
+    result = []
+    for app_label in PROJECT_APPS:
+        app_proposals = [proposal for proposal in proposals
+                         if proposal.model._meta.app_label == app_label]
+        if not app_proposals:
+            continue
+        leaf = max(loader.graph.leaf_nodes(app_label))
+        number = int(leaf[1].split('_', 1)[0]) + 1
+        migration = migrations.Migration(f'{number:04}_advised_indexes',
+                                         app_label)
+        migration.dependencies = [leaf]
+        migration.operations = []
+        if any(proposal.kind != 'btree' for proposal in app_proposals):
+            migration.operations.append(TrigramExtension())
+        for proposal in app_proposals:
+            migration.operations.extend(proposal.operations())
+        result.append(migration)
+    return result
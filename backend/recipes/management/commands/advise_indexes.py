@@ -0,0 +1,241 @@
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.migrations.writer import MigrationWriter
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from api.filters import IngredientFilter
+from recipes.benchmarks import Rollback
+from recipes.index_advisor import (
+    analyze_plan,
+    build_migrations,
+    explain,
+    has_hypopg,
+    hypothetical_cost,
+    measured_time,
+    project_tables,
+)
+from recipes.models import Ingredient, Recipe, ShoppingCart, Tag
+
+User = get_user_model()
+
+HOT_REQUESTS = (
+    ('recipes', '/api/recipes/'),
+    ('recipes-tags', '/api/recipes/?tags={tag}'),
+    ('recipes-author', '/api/recipes/?author={author}'),
+    ('recipes-favorited', '/api/recipes/?is_favorited=1'),
+    ('recipes-shopping-cart', '/api/recipes/?is_in_shopping_cart=1'),
+    ('recipes-search', '/api/recipes/?search={word}'),
+    ('recipes-cursor', '/api/recipes/?cursor='),
+    ('recipes-popular', '/api/recipes/?ordering=popular&cursor='),
+    ('feed', '/api/recipes/feed/'),
+    ('subscriptions', '/api/users/subscriptions/'),
+    ('shopping-list', '/api/recipes/download_shopping_cart/'),
+)
+# Без кеша запросы доходят до базы так же, как при промахе.
+NO_CACHE = {'default': {
+    'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+}}
+
+
+class Command(BaseCommand):
+    help = ('Прогон горячих запросов API через EXPLAIN (ANALYZE, BUFFERS) '
+            'на заполненной базе PostgreSQL: находит последовательные '
+            'чтения больших таблиц и сортировки и предлагает миграции с '
+            'индексами и оценкой выигрыша. Данные не изменяются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int,
+                            help='id пользователя, от имени которого '
+                                 'выполняются запросы.')
+        parser.add_argument('--measure', action='store_true',
+                            help='Строить предложенные индексы в '
+                                 'откатываемой транзакции и замерять '
+                                 'время. Блокирует запись в таблицы, '
+                                 'только для копии базы.')
+        parser.add_argument('--write', action='store_true',
+                            help='Записать миграции в каталоги '
+                                 'приложений.')
+        parser.add_argument('--output',
+                            help='Сохранить отчёт в JSON-файл.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('EXPLAIN (ANALYZE, BUFFERS) есть только в '
+                               'PostgreSQL.')
+        if not Recipe.objects.exists():
+            raise CommandError('Нет рецептов: python manage.py '
+                               'generate_dataset')
+        viewer = self.get_viewer(options['user'])
+        queries = self.collect_queries(viewer)
+
+        report = []
+        proposals = {}
+        try:
+            with transaction.atomic():
+                hypopg = has_hypopg()
+                for name, sql, params in queries:
+                    entry = self.analyze(name, sql, params, proposals,
+                                         hypopg, options['measure'])
+                    report.append(entry)
+                    self.write_entry(entry)
+                raise Rollback
+        except Rollback:
+            pass
+
+        ranked = sorted(proposals.values(),
+                        key=lambda proposal: -sum(proposal.queries.values()))
+        self.stdout.write('')
+        if not ranked:
+            self.stdout.write('Новых индексов не предлагается.')
+        for proposal in ranked:
+            self.stdout.write(
+                f'{proposal.describe()}: выигрыш до '
+                f'{sum(proposal.queries.values()):.1f} мс '
+                f'({", ".join(proposal.queries)})'
+            )
+        for migration in build_migrations(ranked):
+            writer = MigrationWriter(migration)
+            if options['write']:
+                with open(writer.path, 'w', encoding='utf-8') as file:
+                    file.write(writer.as_string())
+                self.stdout.write(f'Записана миграция {writer.path}')
+            else:
+                self.stdout.write(f'\n# {writer.path}\n{writer.as_string()}')
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({
+                    'queries': report,
+                    'proposals': [
+                        {'index': proposal.describe(),
+                         'gain_ms': proposal.queries}
+                        for proposal in ranked
+                    ],
+                }, file, ensure_ascii=False, indent=2)
+
+    def get_viewer(self, user_id):
+        if user_id is not None:
+            viewer = User.objects.filter(pk=user_id).first()
+            if viewer is None:
+                raise CommandError(f'Нет пользователя {user_id}.')
+            return viewer
+        # Пользователь с непустым списком покупок, чтобы выгрузка списка
+        # дошла до агрегации.
+        user_id = (ShoppingCart.objects.order_by('-id')
+                   .values_list('user_id', flat=True).first())
+        viewer = User.objects.filter(pk=user_id).first()
+        return viewer or User.objects.order_by('id').first()
+
+    def get_parameters(self):
+        recipe_name = (Recipe.objects.order_by('-pub_date')
+                       .values_list('name', flat=True).first())
+        ingredient = (Ingredient.objects.order_by('id')
+                      .values_list('name', flat=True).first() or '')
+        return {
+            'tag': Tag.objects.values_list('slug', flat=True).first() or '',
+            'author': (User.objects.order_by('-recipes_count')
+                       .values_list('id', flat=True).first()),
+            'word': recipe_name.split()[0] if recipe_name else '',
+            'prefix': ingredient[:3],
+        }
+
+    def hot_calls(self, viewer):
+        parameters = self.get_parameters()
+        client = APIClient(
+            HTTP_HOST=next((host.lstrip('.') for host in settings.ALLOWED_HOSTS
+                            if host != '*'), 'localhost'),
+        )
+        client.force_authenticate(viewer)
+
+        def request(path):
+            def call():
+                response = client.get(path)
+                if response.status_code != 200:
+                    self.stderr.write(f'{path}: {response.status_code}')
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            return call
+
+        for name, path in HOT_REQUESTS:
+            yield name, request(path.format(**parameters))
+        # Поиск ингредиентов обычно отвечает из памяти, в базу идёт при
+        # устаревшем индексе.
+        yield 'ingredients-search', lambda: list(IngredientFilter(
+            {'name': parameters['prefix']},
+            queryset=Ingredient.objects.all(),
+        ).qs)
+
+    def collect_queries(self, viewer):
+        statements = []
+
+        def capture(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        queries = []
+        seen = set()
+        with override_settings(CACHES=NO_CACHE):
+            for name, call in self.hot_calls(viewer):
+                statements.clear()
+                with connection.execute_wrapper(capture):
+                    call()
+                for number, (sql, params) in enumerate(statements, 1):
+                    if sql not in seen:
+                        seen.add(sql)
+                        queries.append((f'{name}#{number}', sql, params))
+        return queries
+
+    def analyze(self, name, sql, params, proposals, hypopg, measure):
+        plan = explain(sql, params)
+        root = plan['Plan']
+        entry = {
+            'query': name,
+            'sql': sql,
+            'execution_ms': plan['Execution Time'],
+            'shared_hit': root.get('Shared Hit Blocks', 0),
+            'shared_read': root.get('Shared Read Blocks', 0),
+            'problems': [],
+        }
+        for problem, duration, proposal in analyze_plan(plan,
+                                                        project_tables()):
+            finding = {'problem': problem, 'node_ms': round(duration, 2)}
+            entry['problems'].append(finding)
+            if proposal is None or proposal.is_covered():
+                continue
+            proposal = proposals.setdefault(proposal.key, proposal)
+            if measure:
+                gain = plan['Execution Time'] - measured_time(sql, params,
+                                                              proposal)
+                method = 'замер'
+            elif hypopg and proposal.kind == 'btree':
+                cost = root['Total Cost']
+                new_cost = hypothetical_cost(sql, params, proposal)
+                gain = plan['Execution Time'] * (cost - new_cost) / cost
+                method = 'hypopg'
+            else:
+                gain = duration
+                method = 'время узла'
+            gain = round(max(gain, 0), 2)
+            proposal.queries[name] = max(proposal.queries.get(name, 0), gain)
+            finding.update(index=proposal.describe(), gain_ms=gain,
+                           estimate=method)
+        return entry
+
+    def write_entry(self, entry):
+        self.stdout.write(
+            f'{entry["query"]:<28} {entry["execution_ms"]:>9.2f} мс  '
+            f'буферы: {entry["shared_hit"]} из кеша, '
+            f'{entry["shared_read"]} с диска'
+        )
+        for finding in entry['problems']:
+            line = f'    {finding["problem"]} ({finding["node_ms"]} мс)'
+            if 'index' in finding:
+                line += (f' -> {finding["index"]}: -{finding["gain_ms"]} мс '
+                         f'({finding["estimate"]})')
+            self.stdout.write(line)
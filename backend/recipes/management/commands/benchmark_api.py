@@ -0,0 +1,370 @@
+import json
+import platform
+import time
+from datetime import timedelta
+from itertools import cycle
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.autocomplete import ingredient_index
+from api.filters import RecipeFilter
+from api.membership import invalidate_membership
+from recipes.benchmarks import Rollback, percentile
+from recipes.models import (
+    Favorite,
+    Follow,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    Tag,
+    TagRecipe,
+)
+from recipes.signals import (
+    INGREDIENTS_VERSION_KEY,
+    TAGS_VERSION_KEY,
+    bump_version,
+)
+from recipes.rankings import RANKINGS, create_rankings
+
+User = get_user_model()
+
+DEFAULT_SIZES = (100, 1000, 10000)
+DEFAULT_REQUESTS = 50
+WARMUP_REQUESTS = 3
+PREFIX = 'bench'
+TAGS_COUNT = 3
+INGREDIENTS_COUNT = 200
+INGREDIENTS_PER_RECIPE = 5
+VIEWER_RELATIONS = 20
+# Рецепты публикуются равномерно за PUBLISH_PERIOD, число добавлений
+# распределено логарифмически от 1 до MAX_INTERACTIONS.
+PUBLISH_PERIOD = timedelta(days=60)
+MAX_INTERACTIONS = 1000
+RANKING_TOP = 10
+BATCH_SIZE = 2000
+IMAGE = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAf'
+         'FcSJAAAADUlEQVR42mP8/5+hHgAHggJ/PchI7wAAAABJRU5ErkJggg==')
+
+
+class Command(BaseCommand):
+    help = ('Замер задержек (p50/p95/p99), пропускной способности и '
+            'количества SQL-запросов основных эндпоинтов API на '
+            'синтетических данных разного объёма. Данные откатываются '
+            'после замера.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int,
+                            default=DEFAULT_SIZES,
+                            help='Количество рецептов в наборах данных.')
+        parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS,
+                            help='Количество запросов к каждому эндпоинту.')
+        parser.add_argument('--endpoints', nargs='+',
+                            help='Замерить только эти эндпоинты.')
+        parser.add_argument('--output',
+                            help='Сохранить результаты в JSON-файл.')
+        parser.add_argument('--baseline',
+                            help='JSON-файл прошлого замера для сравнения.')
+
+    def handle(self, *args, **options):
+        results = []
+        for size in options['sizes']:
+            dataset = None
+            try:
+                with transaction.atomic():
+                    dataset = self.create_dataset(size)
+                    for name, request in self.get_endpoints(dataset):
+                        if (options['endpoints']
+                                and name not in options['endpoints']):
+                            continue
+                        result = self.measure(request, options['requests'])
+                        result.update(size=size, endpoint=name)
+                        results.append(result)
+                        self.write_result(result)
+                    self.write_rankings(size)
+                    raise Rollback
+            except Rollback:
+                pass
+            finally:
+                if dataset is not None:
+                    self.reset_caches(dataset)
+
+        report = {
+            'meta': {
+                'started': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'requests': options['requests'],
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            self.compare(options['baseline'], results)
+
+    def create_dataset(self, size):
+        authors_count = max(10, size // 10)
+        User.objects.bulk_create(
+            (User(username=f'{PREFIX}-author-{number}',
+                  email=f'{PREFIX}-author-{number}@foodgram.local',
+                  password='!')
+             for number in range(authors_count)),
+            batch_size=BATCH_SIZE,
+        )
+        authors = list(User.objects.filter(
+            username__startswith=f'{PREFIX}-author-'
+        ).values_list('id', flat=True))
+        viewer = User.objects.create_user(
+            username=f'{PREFIX}-viewer',
+            email=f'{PREFIX}-viewer@foodgram.local',
+        )
+        token = Token.objects.create(user=viewer)
+
+        Tag.objects.bulk_create(
+            Tag(name=f'{PREFIX}-tag-{number}',
+                color=f'#b{number:05}',
+                slug=f'{PREFIX}-tag-{number}')
+            for number in range(TAGS_COUNT)
+        )
+        tags = list(Tag.objects.filter(
+            slug__startswith=f'{PREFIX}-tag-'
+        ).values_list('id', flat=True))
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'{PREFIX}-ingredient-{number:04}',
+                       measurement_unit='г')
+            for number in range(INGREDIENTS_COUNT)
+        )
+        ingredients = list(Ingredient.objects.filter(
+            name__startswith=f'{PREFIX}-ingredient-'
+        ).values_list('id', flat=True))
+
+        Recipe.objects.bulk_create(
+            (Recipe(name=f'{PREFIX}-recipe-{number}',
+                    author_id=authors[number % len(authors)],
+                    text='benchmark',
+                    image='recipes/images/benchmark.png',
+                    cooking_time=10,
+                    favorites_count=int(MAX_INTERACTIONS ** (
+                        number * 7919 % size / size
+                    )))
+             for number in range(size)),
+            batch_size=BATCH_SIZE,
+        )
+        # pub_date при вставке всегда текущее время.
+        now = timezone.now()
+        published = list(Recipe.objects.filter(
+            name__startswith=f'{PREFIX}-recipe-'
+        ).only('id'))
+        for number, recipe in enumerate(published):
+            recipe.pub_date = now - PUBLISH_PERIOD * number / size
+        Recipe.objects.bulk_update(published, ['pub_date'],
+                                   batch_size=BATCH_SIZE)
+        recipes = [recipe.id for recipe in published]
+        create_rankings(Recipe.objects.filter(
+            name__startswith=f'{PREFIX}-recipe-'
+        ))
+        IngredientRecipe.objects.bulk_create(
+            (IngredientRecipe(recipe_id=recipe,
+                              ingredient_id=ingredients[
+                                  (number + offset) % len(ingredients)
+                              ],
+                              amount=offset + 1)
+             for number, recipe in enumerate(recipes)
+             for offset in range(INGREDIENTS_PER_RECIPE)),
+            batch_size=BATCH_SIZE,
+        )
+        TagRecipe.objects.bulk_create(
+            (TagRecipe(recipe_id=recipe, tag_id=tags[number % len(tags)])
+             for number, recipe in enumerate(recipes)),
+            batch_size=BATCH_SIZE,
+        )
+        Follow.objects.bulk_create(
+            Follow(user=viewer, author_id=author)
+            for author in authors[:VIEWER_RELATIONS]
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user=viewer, recipe_id=recipe)
+            for recipe in recipes[:VIEWER_RELATIONS]
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=viewer, recipe_id=recipe)
+            for recipe in recipes[-VIEWER_RELATIONS:]
+        )
+        own_recipe = Recipe.objects.create(
+            name=f'{PREFIX}-own-recipe',
+            author=viewer,
+            text='benchmark',
+            image='recipes/images/benchmark.png',
+            cooking_time=10,
+        )
+
+        bump_version(TAGS_VERSION_KEY)
+        ingredient_index.rebuild(bump_version(INGREDIENTS_VERSION_KEY))
+        return {
+            'viewer': viewer,
+            'token': token.key,
+            'authors': authors,
+            'tags': tags,
+            'ingredients': ingredients,
+            'recipes': recipes,
+            'own_recipe': own_recipe.id,
+        }
+
+    def get_endpoints(self, dataset):
+        client = Client(
+            HTTP_AUTHORIZATION=f'Token {dataset["token"]}',
+            HTTP_HOST=next((host.lstrip('.') for host in settings.ALLOWED_HOSTS
+                            if host != '*'), 'localhost'),
+        )
+        recipe_ids = cycle(dataset['recipes'])
+        created = cycle(range(10 ** 9))
+        tag_slug = f'{PREFIX}-tag-0'
+        ingredients = [
+            {'id': ingredient, 'amount': 1}
+            for ingredient in dataset['ingredients'][:INGREDIENTS_PER_RECIPE]
+        ]
+        recipe_body = {
+            'tags': dataset['tags'][:1],
+            'ingredients': ingredients,
+            'text': 'benchmark',
+            'cooking_time': 10,
+        }
+
+        def get(url):
+            return lambda: client.get(url() if callable(url) else url)
+
+        def create_recipe():
+            return client.post(
+                '/api/recipes/',
+                {**recipe_body, 'image': IMAGE,
+                 'name': f'{PREFIX}-created-{next(created)}'},
+                content_type='application/json',
+            )
+
+        def update_recipe():
+            return client.patch(
+                f'/api/recipes/{dataset["own_recipe"]}/',
+                {**recipe_body, 'name': f'{PREFIX}-updated-{next(created)}'},
+                content_type='application/json',
+            )
+
+        def download_shopping_cart():
+            response = client.get('/api/recipes/download_shopping_cart/')
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            return response
+
+        return (
+            ('recipe_list', get('/api/recipes/')),
+            ('recipe_list_cursor', get('/api/recipes/?cursor=')),
+            ('recipe_list_popular',
+             get('/api/recipes/?ordering=popular&cursor=')),
+            ('recipe_list_trending',
+             get('/api/recipes/?ordering=trending&cursor=')),
+            ('recipe_detail',
+             get(lambda: f'/api/recipes/{next(recipe_ids)}/')),
+            ('recipe_list_tags', get(f'/api/recipes/?tags={tag_slug}')),
+            ('recipe_list_favorited', get('/api/recipes/?is_favorited=1')),
+            ('recipe_list_author',
+             get(f'/api/recipes/?author={dataset["authors"][0]}')),
+            ('subscriptions',
+             get('/api/users/subscriptions/?recipes_limit=3')),
+            ('download_shopping_cart', download_shopping_cart),
+            ('ingredient_autocomplete',
+             get(f'/api/ingredients/?name={PREFIX}-ingredient-01')),
+            ('tags', get('/api/tags/')),
+            ('recipe_create', create_recipe),
+            ('recipe_update', update_recipe),
+        )
+
+    def measure(self, request, requests):
+        for _ in range(WARMUP_REQUESTS):
+            request()
+        latencies = []
+        queries = []
+        statuses = set()
+        started = time.perf_counter()
+        for _ in range(requests):
+            with CaptureQueriesContext(connection) as context:
+                request_started = time.perf_counter()
+                response = request()
+                latencies.append(time.perf_counter() - request_started)
+            queries.append(len(context.captured_queries))
+            statuses.add(response.status_code)
+        elapsed = time.perf_counter() - started
+        return {
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'rps': round(requests / elapsed, 1),
+            'queries': round(sum(queries) / len(queries), 1),
+            'statuses': sorted(statuses),
+        }
+
+    def write_result(self, result):
+        self.stdout.write(
+            f'{result["size"]:>7} {result["endpoint"]:<24} '
+            f'p50 {result["p50_ms"]:>8.2f} мс  '
+            f'p95 {result["p95_ms"]:>8.2f} мс  '
+            f'p99 {result["p99_ms"]:>8.2f} мс  '
+            f'{result["rps"]:>8.1f} rps  '
+            f'{result["queries"]:>5.1f} SQL  '
+            f'{result["statuses"]}'
+        )
+
+    def write_rankings(self, size):
+        # Первые рецепты каждой сортировки: медианы возраста и числа
+        # добавлений показывают, насколько выдача отличается от новых.
+        recipes = Recipe.objects.filter(name__startswith=f'{PREFIX}-recipe-')
+        orderings = {'newest': recipes.order_by('-pub_date', '-id')}
+        for name in RANKINGS:
+            orderings[name] = RecipeFilter({'ordering': name},
+                                           queryset=recipes).qs
+        now = timezone.now()
+        for name, queryset in orderings.items():
+            top = list(queryset.values_list(
+                'pub_date', 'favorites_count'
+            )[:RANKING_TOP])
+            ages = [(now - pub_date) / timedelta(days=1)
+                    for pub_date, _ in top]
+            interactions = [favorites for _, favorites in top]
+            self.stdout.write(
+                f'{size:>7} {"ordering=" + name:<24} '
+                f'первые {len(top)}: '
+                f'возраст {percentile(ages, 50):>5.1f} сут, '
+                f'добавлений {percentile(interactions, 50):>5}'
+            )
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as file:
+            baseline = {
+                (result['size'], result['endpoint']): result
+                for result in json.load(file)['results']
+            }
+        self.stdout.write(f'Сравнение с {path}:')
+        for result in results:
+            previous = baseline.get((result['size'], result['endpoint']))
+            if previous is None or not previous['p50_ms']:
+                continue
+            change = (result['p50_ms'] / previous['p50_ms'] - 1) * 100
+            self.stdout.write(
+                f'{result["size"]:>7} {result["endpoint"]:<24} '
+                f'p50 {change:>+7.1f}%  '
+                f'SQL {previous["queries"]:>5.1f} -> {result["queries"]:.1f}'
+            )
+
+    def reset_caches(self, dataset):
+        # Откаченные данные не должны остаться в кеше.
+        bump_version(TAGS_VERSION_KEY)
+        bump_version(INGREDIENTS_VERSION_KEY)
+        invalidate_membership(dataset['viewer'].id)
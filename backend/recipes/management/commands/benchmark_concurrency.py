@@ -0,0 +1,144 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from recipes.benchmarks import percentile
+from recipes.counters import change_counters
+from recipes.models import Follow, Ingredient, Recipe, ShoppingCart
+
+User = get_user_model()
+
+DEFAULT_CONCURRENCY = (1, 16, 64)
+DEFAULT_REQUESTS = 200
+VIEWER_RELATIONS = 20
+PREFIX = 'concurrency'
+
+
+class Command(BaseCommand):
+    help = ('Сравнение пропускной способности запущенных серверов '
+            '(например, WSGI и ASGI с ASYNC_READ_VIEWS) на эндпоинтах '
+            'чтения при разном числе одновременных соединений. '
+            'Серверы должны работать с той же базой данных.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='+', metavar='NAME=URL',
+                            help='Например: wsgi=http://localhost:8000')
+        parser.add_argument('--concurrency', nargs='+', type=int,
+                            default=DEFAULT_CONCURRENCY)
+        parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS,
+                            help='Запросов к эндпоинту на каждый замер.')
+        parser.add_argument('--endpoints', nargs='+',
+                            help='Замерить только эти эндпоинты.')
+        parser.add_argument('--output',
+                            help='Сохранить результаты в JSON-файл.')
+
+    def handle(self, *args, **options):
+        targets = [target.split('=', 1) for target in options['targets']]
+        if any(len(target) != 2 for target in targets):
+            raise CommandError('Цели указываются как NAME=URL.')
+        if not Recipe.objects.exists():
+            raise CommandError('Нет рецептов: python manage.py '
+                               'generate_dataset')
+        if User.objects.filter(username=f'{PREFIX}-viewer').exists():
+            raise CommandError(f'Удалите пользователя {PREFIX}-viewer.')
+
+        results = []
+        try:
+            token = self.create_viewer()
+            for name, path in self.get_endpoints():
+                if options['endpoints'] and name not in options['endpoints']:
+                    continue
+                for concurrency in options['concurrency']:
+                    for target, base_url in targets:
+                        result = self.measure(
+                            base_url.rstrip('/') + path, token,
+                            concurrency, options['requests'],
+                        )
+                        result.update(target=target, endpoint=name,
+                                      concurrency=concurrency)
+                        results.append(result)
+                        self.write_result(result)
+        finally:
+            User.objects.filter(username=f'{PREFIX}-viewer').delete()
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({'results': results}, file, ensure_ascii=False,
+                          indent=2)
+
+    def create_viewer(self):
+        viewer = User.objects.create_user(
+            username=f'{PREFIX}-viewer',
+            email=f'{PREFIX}-viewer@foodgram.local',
+        )
+        authors = (User.objects.exclude(pk=viewer.pk)
+                   .order_by('-recipes_count')[:VIEWER_RELATIONS])
+        recipes = Recipe.objects.order_by('-pub_date')[:VIEWER_RELATIONS]
+        for model, rows in (
+            (Follow, [Follow(user=viewer, author=author)
+                      for author in authors]),
+            (ShoppingCart, [ShoppingCart(user=viewer, recipe=recipe)
+                            for recipe in recipes]),
+        ):
+            model.objects.bulk_create(rows)
+            change_counters(model, rows, 1)
+        return Token.objects.create(user=viewer).key
+
+    def get_endpoints(self):
+        recipe = Recipe.objects.order_by('-pub_date').first()
+        ingredient = Ingredient.objects.order_by('name').first()
+        prefix = ingredient.name[:3] if ingredient else ''
+        return (
+            ('recipe_list', '/api/recipes/'),
+            ('recipe_detail', f'/api/recipes/{recipe.id}/'),
+            ('tags', '/api/tags/'),
+            ('ingredients', f'/api/ingredients/?name={prefix}'),
+            ('subscriptions', '/api/users/subscriptions/?recipes_limit=3'),
+            ('download_shopping_cart',
+             '/api/recipes/download_shopping_cart/'),
+        )
+
+    def measure(self, url, token, concurrency, count):
+        local = threading.local()
+
+        def request():
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+                local.session.headers['Authorization'] = f'Token {token}'
+            started = time.perf_counter()
+            try:
+                status = local.session.get(url).status_code
+            except requests.RequestException:
+                status = None
+            return time.perf_counter() - started, status
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            list(executor.map(lambda _: request(), range(concurrency)))
+            started = time.perf_counter()
+            measured = list(executor.map(lambda _: request(), range(count)))
+            elapsed = time.perf_counter() - started
+        latencies = [latency for latency, _ in measured]
+        return {
+            'rps': round(count / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'errors': sum(status != 200 for _, status in measured),
+        }
+
+    def write_result(self, result):
+        self.stdout.write(
+            f'{result["endpoint"]:<24} {result["target"]:<8} '
+            f'x{result["concurrency"]:<4} '
+            f'{result["rps"]:>8.1f} rps  '
+            f'p50 {result["p50_ms"]:>8.2f} мс  '
+            f'p95 {result["p95_ms"]:>8.2f} мс  '
+            f'p99 {result["p99_ms"]:>8.2f} мс  '
+            f'ошибок {result["errors"]}'
+        )
@@ -0,0 +1,163 @@
+import json
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from api.feed import feed_rows
+from api.pagination import keyset_slice
+from recipes.benchmarks import Rollback, percentile
+from recipes.models import Follow, Recipe
+from recipes.rankings import create_rankings
+from recipes.timelines import BACKFILL_MAX_RECIPES, rebuild_timelines
+
+User = get_user_model()
+
+DEFAULT_FOLLOWS = (10, 100, 1000)
+DEFAULT_RECIPES_PER_AUTHOR = 10
+DEFAULT_PROLIFIC = 3
+DEFAULT_REQUESTS = 50
+DEEP_PAGE = 20  # Страница, до которой листается лента
+PAGE_SIZE = 6
+PREFIX = 'feed-bench'
+BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = ('Сравнение ленты подписок с запросом по подпискам в лоб '
+            'при разном числе подписок. Данные откатываются после '
+            'замера.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--follows', nargs='+', type=int,
+                            default=DEFAULT_FOLLOWS,
+                            help='Количество подписок читателя.')
+        parser.add_argument('--recipes-per-author', type=int,
+                            default=DEFAULT_RECIPES_PER_AUTHOR)
+        parser.add_argument('--prolific', type=int, default=DEFAULT_PROLIFIC,
+                            help='Сколько из подписок — популярные авторы.')
+        parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS)
+        parser.add_argument('--output',
+                            help='Сохранить результаты в JSON-файл.')
+
+    def handle(self, *args, **options):
+        results = []
+        for follows in options['follows']:
+            try:
+                with transaction.atomic():
+                    dataset = self.create_dataset(
+                        follows, options['recipes_per_author'],
+                        min(options['prolific'], follows),
+                    )
+                    for name, call in self.get_cases(dataset):
+                        result = self.measure(call, options['requests'])
+                        result.update(follows=follows, case=name)
+                        results.append(result)
+                        self.write_result(result)
+                    raise Rollback
+            except Rollback:
+                pass
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({'database': connection.vendor,
+                           'results': results},
+                          file, ensure_ascii=False, indent=2)
+
+    def create_dataset(self, follows, recipes_per_author, prolific):
+        User.objects.bulk_create(
+            (User(username=f'{PREFIX}-author-{number}',
+                  email=f'{PREFIX}-author-{number}@foodgram.local',
+                  password='!')
+             for number in range(follows)),
+            batch_size=BATCH_SIZE,
+        )
+        authors = list(User.objects.filter(
+            username__startswith=f'{PREFIX}-author-'
+        ).values_list('id', flat=True))
+        viewer = User.objects.create_user(
+            username=f'{PREFIX}-viewer',
+            email=f'{PREFIX}-viewer@foodgram.local',
+        )
+        token = Token.objects.create(user=viewer)
+
+        # Популярные авторы публикуют больше, чем копируется в ленту
+        # при подписке; рецепты авторов чередуются по дате.
+        counts = {author: recipes_per_author for author in authors}
+        for author in authors[:prolific]:
+            counts[author] = BACKFILL_MAX_RECIPES
+        Recipe.objects.bulk_create(
+            (Recipe(name=f'{PREFIX}-recipe-{author}-{number}',
+                    author_id=author,
+                    text='benchmark',
+                    image='recipes/images/benchmark.png',
+                    cooking_time=10)
+             for number in range(max(counts.values()))
+             for author in authors
+             if number < counts[author]),
+            batch_size=BATCH_SIZE,
+        )
+        create_rankings(Recipe.objects.filter(author_id__in=authors))
+        User.objects.filter(pk__in=authors[:prolific]).update(
+            is_prolific=True, recipes_count=BACKFILL_MAX_RECIPES,
+        )
+        Follow.objects.bulk_create(
+            (Follow(user=viewer, author_id=author) for author in authors),
+            batch_size=BATCH_SIZE,
+        )
+        # Подписки записаны в обход сигналов.
+        rebuild_timelines([viewer.id])
+
+        deep = None
+        for _ in range(DEEP_PAGE):
+            page = feed_rows(viewer.id, False, deep, PAGE_SIZE)
+            if not page:
+                break
+            deep = page[-1].pub_date, page[-1].pk
+        return {'viewer': viewer, 'token': token.key, 'deep': deep}
+
+    def get_cases(self, dataset):
+        viewer = dataset['viewer']
+        naive = Recipe.objects.filter(
+            author__followed_by__user=viewer
+        ).values_list('pk', 'updated_at', 'author_id', 'pub_date')
+        client = Client(
+            HTTP_AUTHORIZATION=f'Token {dataset["token"]}',
+            HTTP_HOST=next((host.lstrip('.') for host in settings.ALLOWED_HOSTS
+                            if host != '*'), 'localhost'),
+        )
+        for page, position in (('first', None), ('deep', dataset['deep'])):
+            yield f'naive-{page}', lambda position=position: list(
+                keyset_slice(naive, False, position, PAGE_SIZE + 1)
+            )
+            yield f'timeline-{page}', lambda position=position: feed_rows(
+                viewer.id, False, position, PAGE_SIZE + 1
+            )
+        yield 'endpoint-first', lambda: client.get('/api/recipes/feed/')
+
+    def measure(self, call, requests):
+        call()
+        durations = []
+        with CaptureQueriesContext(connection) as context:
+            for _ in range(requests):
+                started = time.perf_counter()
+                call()
+                durations.append((time.perf_counter() - started) * 1000)
+        return {
+            'p50_ms': round(percentile(durations, 50), 2),
+            'p95_ms': round(percentile(durations, 95), 2),
+            'queries': len(context.captured_queries) // requests,
+        }
+
+    def write_result(self, result):
+        self.stdout.write(
+            f'{result["follows"]:>6} подписок  {result["case"]:<16} '
+            f'p50 {result["p50_ms"]:>8.2f} мс  '
+            f'p95 {result["p95_ms"]:>8.2f} мс  '
+            f'запросов {result["queries"]}'
+        )
@@ -0,0 +1,95 @@
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.views import RecipeViewSet
+from recipes.benchmarks import Rollback
+from recipes.models import Ingredient, IngredientRecipe, Recipe, ShoppingCart
+
+User = get_user_model()
+
+DEFAULT_SIZES = (10, 1000, 50000)
+
+
+class Command(BaseCommand):
+    help = ('Замер памяти и времени выгрузки списка покупок. '
+            'Все тестовые данные откатываются после замера.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int,
+                            default=DEFAULT_SIZES)
+        parser.add_argument('--format', dest='export_format', default='txt',
+                            choices=('txt', 'csv', 'json'))
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{"строк":>8} {"первый байт, мс":>16} {"всего, мс":>10} '
+            f'{"пик памяти, КБ":>15} {"размер, КБ":>11}'
+        )
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    user = self.create_cart(size)
+                    first_byte, total, length = self.measure(
+                        user, options['export_format']
+                    )
+                    tracemalloc.start()
+                    self.measure(user, options['export_format'])
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    raise Rollback
+            except Rollback:
+                pass
+            self.stdout.write(
+                f'{size:>8} {first_byte * 1000:>16.1f} {total * 1000:>10.1f} '
+                f'{peak / 1024:>15.0f} {length / 1024:>11.0f}'
+            )
+
+    def create_cart(self, size):
+        user = User.objects.create_user(
+            username='benchmark_shopping_cart',
+            email='benchmark_shopping_cart@foodgram.local',
+        )
+        recipe = Recipe.objects.create(
+            name='benchmark_shopping_cart',
+            author=user,
+            text='benchmark',
+            image='recipes/images/benchmark.png',
+            cooking_time=1,
+        )
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=f'benchmark-{number:06}', measurement_unit='г')
+             for number in range(size)),
+            batch_size=5000,
+        )
+        ingredients = Ingredient.objects.filter(name__startswith='benchmark-')
+        IngredientRecipe.objects.bulk_create(
+            (IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+             for ingredient in ingredients),
+            batch_size=5000,
+        )
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+        return user
+
+    def measure(self, user, export_format):
+        request = APIRequestFactory().get(
+            '/api/recipes/download_shopping_cart/',
+            {'format': export_format},
+        )
+        force_authenticate(request, user=user)
+        view = RecipeViewSet.as_view(
+            {'get': 'download_shopping_cart'},
+            **RecipeViewSet.download_shopping_cart.kwargs,
+        )
+        started = time.perf_counter()
+        response = view(request)
+        content = iter(response.streaming_content)
+        length = len(next(content))
+        first_byte = time.perf_counter() - started
+        for chunk in content:
+            length += len(chunk)
+        return first_byte, time.perf_counter() - started, length
@@ -0,0 +1,317 @@
+import multiprocessing
+import random
+import time
+from array import array
+from datetime import timedelta
+from io import StringIO
+from itertools import accumulate, islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from recipes.counters import reconcile_counters
+from recipes.models import (
+    Favorite,
+    Follow,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    Tag,
+    TagRecipe,
+)
+from recipes.rankings import create_rankings, refresh_rankings
+from recipes.signals import TAGS_VERSION_KEY, bump_version
+from recipes.timelines import rebuild_timelines
+
+User = get_user_model()
+
+DEFAULT_BATCH_SIZE = 10000
+TASK_SIZE = 5000  # Количество пользователей или рецептов в одной задаче
+POWER_LAW_EXPONENT = 1.1
+PUB_DATE_SPREAD = timedelta(days=365)
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+
+# Заполняется в родительском процессе до запуска пула и наследуется
+# дочерними процессами при fork.
+context = {}
+
+
+def power_law_weights(count):
+    return list(accumulate(
+        1 / (rank ** POWER_LAW_EXPONENT) for rank in range(1, count + 1)
+    ))
+
+
+def load_ids(queryset):
+    return array('q', queryset.order_by('id').values_list('id', flat=True)
+                 .iterator())
+
+
+def shuffled(ids, rng):
+    ids = list(ids)
+    rng.shuffle(ids)
+    return array('q', ids)
+
+
+def sample_distinct(rng, ids, cum_weights, count, exclude=None):
+    count = min(count, len(ids) // 2)
+    chosen = set()
+    while len(chosen) < count:
+        for index in rng.choices(range(len(ids)), cum_weights=cum_weights,
+                                 k=count - len(chosen)):
+            pk = ids[index]
+            if pk != exclude:
+                chosen.add(pk)
+    return chosen
+
+
+def copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def write_batch(model, fields, rows):
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(model._meta.get_field(
+        field).column) for field in fields)
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            buffer = StringIO()
+            for row in rows:
+                buffer.write('\t'.join(copy_value(value) for value in row))
+                buffer.write('\n')
+            buffer.seek(0)
+            cursor.copy_expert(
+                f'COPY {table} ({columns}) FROM STDIN', buffer
+            )
+            return
+        placeholders = ', '.join(['%s'] * len(fields))
+        cursor.executemany(
+            f'INSERT INTO {table} ({columns}) VALUES ({placeholders})',
+            [[connection.ops.adapt_datetimefield_value(value)
+              if hasattr(value, 'isoformat') else value
+              for value in row] for row in rows],
+        )
+
+
+def write_rows(model, fields, rows, batch_size):
+    written = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return written
+        write_batch(model, fields, batch)
+        written += len(batch)
+
+
+def user_rows(rng, start, end):
+    prefix = context['prefix']
+    joined = context['now']
+    for number in range(start, end):
+        yield (f'{prefix}-{number}', f'{prefix}-{number}@foodgram.local',
+               '!', 'Имя', 'Фамилия', User.Role.user.value,
+               False, False, True, joined, 0, 0, False)
+
+
+def recipe_rows(rng, start, end):
+    prefix = context['prefix']
+    authors = context['users']
+    weights = context['user_weights']
+    now = context['now']
+    spread = PUB_DATE_SPREAD.total_seconds()
+    for number in range(start, end):
+        author = authors[rng.choices(range(len(authors)),
+                                     cum_weights=weights)[0]]
+        pub_date = now - timedelta(seconds=rng.random() * spread)
+        yield (f'{prefix}-recipe-{number}', author, 'Синтетический рецепт.',
+               'recipes/images/synthetic.png', rng.randint(5, 180),
+               pub_date, pub_date, 0, 0)
+
+
+def ingredient_recipe_rows(rng, start, end):
+    recipes = context['recipes']
+    ingredients = context['ingredients']
+    weights = context['ingredient_weights']
+    low, high = context['ingredients_per_recipe']
+    for recipe in recipes[start:end]:
+        for ingredient in sample_distinct(rng, ingredients, weights,
+                                          rng.randint(low, high)):
+            yield recipe, ingredient, rng.randint(1, 500)
+
+
+def tag_recipe_rows(rng, start, end):
+    recipes = context['recipes']
+    tags = context['tags']
+    for recipe in recipes[start:end]:
+        for tag in rng.sample(list(tags), rng.randint(1, len(tags))):
+            yield tag, recipe
+
+
+def user_relation_rows(targets_key, weights_key, average, exclude_self):
+    def rows(rng, start, end):
+        users = context['users']
+        targets = context[targets_key]
+        weights = context[weights_key]
+        for user in users[start:end]:
+            count = rng.randint(0, 2 * context[average])
+            exclude = user if exclude_self else None
+            for target in sample_distinct(rng, targets, weights, count,
+                                          exclude):
+                yield user, target
+    return rows
+
+
+RELATIONS = {
+    'ingredients': (IngredientRecipe, ('recipe', 'ingredient', 'amount'),
+                    ingredient_recipe_rows, 'recipes'),
+    'tags': (TagRecipe, ('tag', 'recipe'), tag_recipe_rows, 'recipes'),
+    'follows': (Follow, ('user', 'author'),
+                user_relation_rows('users', 'user_weights', 'follows', True),
+                'users'),
+    'favorites': (Favorite, ('user', 'recipe'),
+                  user_relation_rows('recipes', 'recipe_weights',
+                                     'favorites', False),
+                  'users'),
+    'carts': (ShoppingCart, ('user', 'recipe'),
+              user_relation_rows('recipes', 'recipe_weights', 'carts', False),
+              'users'),
+}
+
+
+def run_task(task):
+    kind, start, end = task
+    model, fields, rows, _ = RELATIONS[kind]
+    rng = random.Random(f'{context["seed"]}:{kind}:{start}')
+    return kind, write_rows(model, fields, rows(rng, start, end),
+                            context['batch_size'])
+
+
+class Command(BaseCommand):
+    help = ('Генерация синтетических пользователей, рецептов, подписок, '
+            'избранного и списков покупок для нагрузочного тестирования.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--prefix', default='synthetic',
+                            help='Префикс имён пользователей и рецептов.')
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Среднее число подписок на пользователя.')
+        parser.add_argument('--favorites', type=int, default=30,
+                            help='Среднее число рецептов в избранном.')
+        parser.add_argument('--carts', type=int, default=5,
+                            help='Среднее число рецептов в списке покупок.')
+        parser.add_argument('--ingredients-per-recipe', type=int, nargs=2,
+                            default=(3, 12), metavar=('MIN', 'MAX'))
+        parser.add_argument('--workers', type=int,
+                            default=multiprocessing.cpu_count())
+        parser.add_argument('--batch-size', type=int,
+                            default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(
+                f'Данные с префиксом {prefix} уже есть, укажите --prefix.'
+            )
+        ingredients = load_ids(Ingredient.objects.all())
+        if not ingredients:
+            raise CommandError('Сначала загрузите ингредиенты: '
+                               'python manage.py load_ingredients')
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in DEFAULT_TAGS
+            )
+            bump_version(TAGS_VERSION_KEY)
+        workers = options['workers']
+        if connection.vendor == 'sqlite':
+            workers = 1  # SQLite не допускает параллельной записи
+
+        rng = random.Random(options['seed'])
+        context.update(
+            seed=options['seed'],
+            prefix=prefix,
+            now=timezone.now(),
+            batch_size=options['batch_size'],
+            follows=options['follows'],
+            favorites=options['favorites'],
+            carts=options['carts'],
+            ingredients_per_recipe=options['ingredients_per_recipe'],
+            ingredients=shuffled(ingredients, rng),
+            ingredient_weights=power_law_weights(len(ingredients)),
+            tags=load_ids(Tag.objects.all()),
+        )
+
+        started = time.perf_counter()
+        self.generate(User, ('username', 'email', 'password', 'first_name',
+                             'last_name', 'role', 'is_superuser', 'is_staff',
+                             'is_active', 'date_joined', 'recipes_count',
+                             'followers_count', 'is_prolific'),
+                      user_rows, options['users'])
+        context['users'] = shuffled(load_ids(
+            User.objects.filter(username__startswith=f'{prefix}-')
+        ), rng)
+        context['user_weights'] = power_law_weights(len(context['users']))
+
+        self.generate(Recipe, ('name', 'author', 'text', 'image',
+                               'cooking_time', 'pub_date', 'updated_at',
+                               'favorites_count', 'shopping_cart_count'),
+                      recipe_rows, options['recipes'])
+        recipes = Recipe.objects.filter(name__startswith=f'{prefix}-recipe-')
+        # Без строки оценки рецепт не попадёт в ?ordering=popular|trending
+        # до конца генерации.
+        create_rankings(recipes, options['batch_size'])
+        context['recipes'] = shuffled(load_ids(recipes), rng)
+        context['recipe_weights'] = power_law_weights(len(context['recipes']))
+
+        tasks = [
+            (kind, start, min(start + TASK_SIZE, len(context[owners])))
+            for kind, (_, _, _, owners) in RELATIONS.items()
+            for start in range(0, len(context[owners]), TASK_SIZE)
+        ]
+        totals = dict.fromkeys(RELATIONS, 0)
+        if workers > 1:
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                for kind, written in pool.imap_unordered(run_task, tasks):
+                    totals[kind] += written
+        else:
+            for task in tasks:
+                kind, written = run_task(task)
+                totals[kind] += written
+        # Строки записаны в обход сигналов, счётчики, ленты и оценки
+        # пересчитываются разом.
+        reconcile_counters(options['batch_size'])
+        rebuild_timelines()
+        refresh_rankings(options['batch_size'])
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'Пользователей: {len(context["users"])}, '
+            f'рецептов: {len(context["recipes"])}, '
+            f'ингредиентов в рецептах: {totals["ingredients"]}, '
+            f'тегов в рецептах: {totals["tags"]}, '
+            f'подписок: {totals["follows"]}, '
+            f'в избранном: {totals["favorites"]}, '
+            f'в списках покупок: {totals["carts"]}. '
+            f'Время: {elapsed:.1f} с.'
+        )
+
+    def generate(self, model, fields, rows, count):
+        rng = random.Random(f'{context["seed"]}:{model._meta.model_name}')
+        write_rows(model, fields, rows(rng, 0, count), context['batch_size'])
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_variants
+from recipes.models import Recipe
+from recipes.signals import touch_recipes
+
+
+class Command(BaseCommand):
+    help = 'Подготовка уменьшенных WebP-копий картинок рецептов.'
+
+    def handle(self, *args, **options):
+        storage = Recipe._meta.get_field('image').storage
+        names = (
+            Recipe.objects
+            .exclude(image='')
+            .order_by()
+            .values_list('image', flat=True)
+            .distinct()
+            .iterator()
+        )
+        processed = 0
+        failed = 0
+        for name in names:
+            try:
+                if generate_variants(storage, name):
+                    touch_recipes(Recipe.objects.filter(image=name))
+                processed += 1
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+        return (f'Обработано {processed} картинок. '
+                f'Ошибок - {failed}')
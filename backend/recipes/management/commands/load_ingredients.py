@@ -1,38 +1,134 @@
 import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
-from django.db import IntegrityError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
 
 from recipes.models import Ingredient
+from recipes.signals import INGREDIENTS_VERSION_KEY, bump_version
 
-from api.serializers import IngredientLoadSerializer
+DEFAULT_BATCH_SIZE = 1000
+READ_CHUNK_SIZE = 64 * 1024
+NAME_MAX_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_MAX_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
+
+
+def read_csv(file):
+    yield from csv.DictReader(file)
+
+
+def read_json(file):
+    # Поэлементное чтение JSON-массива без загрузки файла целиком.
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    while True:
+        chunk = file.read(READ_CHUNK_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] != '[':
+                    raise CommandError('Ожидался JSON-массив ингредиентов.')
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise CommandError('Файл JSON оборван.')
+                break
+            yield item
+        if not chunk:
+            return
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+def clean_row(row):
+    if not isinstance(row, dict):
+        return None
+    name = row.get('name')
+    measurement_unit = row.get('measurement_unit')
+    if not isinstance(name, str) or not isinstance(measurement_unit, str):
+        return None
+    name = name.strip()
+    measurement_unit = measurement_unit.strip()
+    if not name or not measurement_unit:
+        return None
+    if (len(name) > NAME_MAX_LENGTH
+            or len(measurement_unit) > UNIT_MAX_LENGTH):
+        return None
+    return name, measurement_unit
+
+
+def insert_batch(rows):
+    table = connection.ops.quote_name(Ingredient._meta.db_table)
+    placeholders = ', '.join(['(%s, %s)'] * len(rows))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (name, measurement_unit) '
+            f'VALUES {placeholders} '
+            f'ON CONFLICT (name, measurement_unit) DO NOTHING',
+            [value for row in rows for value in row],
+        )
+        return cursor.rowcount
 
 
 class Command(BaseCommand):
     help = 'Загрузка ингредиентов.'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=f'{settings.BASE_DIR}/data/ingredients.csv',
+            help='Файл .csv или .json с полями name и measurement_unit.',
+        )
+        parser.add_argument('--batch-size', type=int,
+                            default=DEFAULT_BATCH_SIZE)
+
     def handle(self, *args, **options):
-        with open(f'{settings.BASE_DIR}/data/ingredients.csv',
-                  'r',
-                  encoding='utf-8',
-                  ) as csv_file:
-            reader = csv.DictReader(csv_file)
-            ingredient_list = []
-            csv_errors = 0
-            for csv_data in reader:
-                serializer = IngredientLoadSerializer(
-                    data={**csv_data},
-                )
-                serializer.is_valid(raise_exception=True)
-                if serializer.is_valid():
-                    ingredient_list.append(Ingredient(**csv_data))
-                else:
-                    csv_errors += 1
+        path = Path(options['path'])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json.')
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+        inserted = skipped = invalid = 0
 
-            try:
-                Ingredient.objects.bulk_create(ingredient_list)
-            except IntegrityError:
-                return 'Такой ингредиент уже существует.'
-        return (f'Загружено {Ingredient.objects.count()} ингредиентов.'
-                f'Ошибок в csv файле - {csv_errors}')
+        with open(path, 'r', encoding='utf-8', newline='') as file:
+            rows = reader(file)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                cleaned = [clean_row(row) for row in batch]
+                valid = [row for row in cleaned if row is not None]
+                invalid += len(batch) - len(valid)
+                if valid:
+                    count = insert_batch(list(dict.fromkeys(valid)))
+                    inserted += count
+                    skipped += len(valid) - count
+
+        bump_version(INGREDIENTS_VERSION_KEY)
+        elapsed = time.perf_counter() - started
+        return (f'Загружено {inserted} ингредиентов, '
+                f'уже были в базе - {skipped}, '
+                f'ошибок в файле - {invalid}. '
+                f'Время: {elapsed:.2f} с.')
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.timelines import rebuild_timelines
+
+
+class Command(BaseCommand):
+    help = ('Пересборка лент подписок: отмечает популярных авторов и '
+            'заново заполняет ленты рецептами остальных авторов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', nargs='+', type=int,
+                            help='Пересобрать ленты только этих '
+                                 'пользователей.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = rebuild_timelines(options['users'])
+        elapsed = time.perf_counter() - started
+        return f'Записей в лентах: {written}. Время: {elapsed:.2f} с.'
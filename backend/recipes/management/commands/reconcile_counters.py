@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.counters import DEFAULT_BATCH_SIZE, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт денормализованных счётчиков избранного, списков '
+            'покупок, рецептов и подписчиков.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        repaired = reconcile_counters(options['batch_size'])
+        elapsed = time.perf_counter() - started
+        details = ', '.join(
+            f'{counter} - {count}' for counter, count in repaired.items()
+        )
+        return f'Исправлено счётчиков: {details}. Время: {elapsed:.2f} с.'
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.rankings import DEFAULT_BATCH_SIZE, refresh_rankings
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт оценок для сортировки рецептов по популярности и '
+            'актуальности. Пересчитываются только рецепты с изменившимися '
+            'счётчиками; запускается периодически, например из cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--full', action='store_true',
+                            help='Пересчитать оценки всех рецептов, '
+                                 'например после изменения формулы.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        refreshed = refresh_rankings(options['batch_size'], options['full'])
+        elapsed = time.perf_counter() - started
+        return (f'Добавлено оценок: {refreshed["created"]}, '
+                f'обновлено: {refreshed["updated"]}. '
+                f'Время: {elapsed:.2f} с.')
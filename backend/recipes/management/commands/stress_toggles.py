@@ -0,0 +1,131 @@
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from recipes.counters import COUNTERS, actual_count
+from recipes.models import Recipe
+
+User = get_user_model()
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_ROUNDS = 20
+PREFIX = 'stress'
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочная проверка одновременных запросов к favorite, '
+            'shopping_cart и subscribe: из одинаковых запросов ровно один '
+            'должен изменить данные, остальные получить 400 или 404. '
+            'Созданные данные удаляются после проверки.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int,
+                            default=DEFAULT_CONCURRENCY,
+                            help='Количество одновременных запросов.')
+        parser.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS)
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=f'{PREFIX}-').exists():
+            raise CommandError(f'Удалите пользователей {PREFIX}-*.')
+        try:
+            dataset = self.create_dataset()
+            failures = 0
+            for name, url in self.get_endpoints(dataset):
+                failures += self.stress(name, url, dataset['token'], options)
+            failures += self.check_counters(dataset)
+        finally:
+            User.objects.filter(username__startswith=f'{PREFIX}-').delete()
+        if failures:
+            raise CommandError(f'Нарушений: {failures}.')
+        return 'Нарушений не найдено.'
+
+    def create_dataset(self):
+        clicker = User.objects.create_user(
+            username=f'{PREFIX}-clicker',
+            email=f'{PREFIX}-clicker@foodgram.local',
+        )
+        author = User.objects.create_user(
+            username=f'{PREFIX}-author',
+            email=f'{PREFIX}-author@foodgram.local',
+        )
+        recipe = Recipe.objects.create(
+            name=f'{PREFIX}-recipe',
+            author=author,
+            text='stress',
+            cooking_time=10,
+        )
+        return {
+            'token': Token.objects.create(user=clicker).key,
+            'author': author,
+            'recipe': recipe,
+        }
+
+    def get_endpoints(self, dataset):
+        return (
+            ('favorite', f'/api/recipes/{dataset["recipe"].id}/favorite/'),
+            ('shopping_cart',
+             f'/api/recipes/{dataset["recipe"].id}/shopping_cart/'),
+            ('subscribe', f'/api/users/{dataset["author"].id}/subscribe/'),
+        )
+
+    def stress(self, name, url, token, options):
+        concurrency = options['concurrency']
+        expected = {
+            'post': Counter({201: 1, 400: concurrency - 1}),
+            'delete': Counter({204: 1, 404: concurrency - 1}),
+        }
+        failures = 0
+        for _ in range(options['rounds']):
+            for method in ('post', 'delete'):
+                statuses = self.burst(method, url, token, concurrency)
+                if statuses != expected[method]:
+                    failures += 1
+                    self.stderr.write(
+                        f'{name} {method.upper()}: {dict(statuses)}'
+                    )
+        self.stdout.write(f'{name:<14} раундов: {options["rounds"]}, '
+                          f'нарушений: {failures}')
+        return failures
+
+    def burst(self, method, url, token, concurrency):
+        barrier = threading.Barrier(concurrency)
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS
+                     if host != '*'), 'localhost')
+
+        def request():
+            client = Client(HTTP_AUTHORIZATION=f'Token {token}',
+                            HTTP_HOST=host,
+                            raise_request_exception=False)
+            barrier.wait()
+            try:
+                return getattr(client, method)(url).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            futures = [executor.submit(request) for _ in range(concurrency)]
+            return Counter(future.result() for future in futures)
+
+    def check_counters(self, dataset):
+        failures = 0
+        targets = {Recipe: dataset['recipe'].pk, User: dataset['author'].pk}
+        for model, field, relation, key in COUNTERS:
+            stored, actual = (
+                model.objects
+                .filter(pk=targets[model])
+                .annotate(actual=actual_count(relation, key))
+                .values_list(field, 'actual')
+                .get()
+            )
+            if stored != actual:
+                failures += 1
+                self.stderr.write(f'{model._meta.model_name}.{field}: '
+                                  f'{stored} != {actual}')
+        return failures
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.3 on 2026-10-18 06:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_alter_recipe_options'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['pub_date', 'id'], name='recipe_pub_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 3.2.3 on 2026-10-18 06:18
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    # Прежний load_ingredients не проверял повторы, и после повторной
+    # загрузки ингредиенты задвоены. Рецепты переводятся на ингредиент с
+    # наименьшим id, остальные копии удаляются.
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    duplicates = (
+        Ingredient.objects
+        .values('name', 'measurement_unit')
+        .annotate(keep=Min('id'), copies=Count('id'))
+        .filter(copies__gt=1)
+        .order_by()
+    )
+    kept = []
+    for group in duplicates.iterator():
+        copies = Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit'],
+        ).exclude(id=group['keep'])
+        IngredientRecipe.objects.filter(ingredient__in=copies).update(
+            ingredient_id=group['keep'],
+        )
+        copies.delete()
+        kept.append(group['keep'])
+    # Рецепт мог ссылаться на несколько копий: количества складываются
+    # в одну строку.
+    repeated = (
+        IngredientRecipe.objects
+        .filter(ingredient_id__in=kept)
+        .values('recipe_id', 'ingredient_id')
+        .annotate(keep=Min('id'), total=Sum('amount'), rows=Count('id'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for row in repeated.iterator():
+        IngredientRecipe.objects.filter(id=row['keep']).update(
+            amount=row['total'],
+        )
+        IngredientRecipe.objects.filter(
+            recipe_id=row['recipe_id'], ingredient_id=row['ingredient_id'],
+        ).exclude(id=row['keep']).delete()
+    if schema_editor.connection.vendor == 'postgresql':
+        # Отложенные проверки внешних ключей не дают изменить таблицу
+        # в той же транзакции.
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_ingredients,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.3 on 2026-10-18 06:28
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipes.Recipe', 'favorites_count', 'recipes.Favorite', 'recipe'),
+    ('recipes.Recipe', 'shopping_cart_count', 'recipes.ShoppingCart',
+     'recipe'),
+    (settings.AUTH_USER_MODEL, 'recipes_count', 'recipes.Recipe', 'author'),
+    (settings.AUTH_USER_MODEL, 'followers_count', 'recipes.Follow', 'author'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model, field, relation, key in COUNTERS:
+        relation = apps.get_model(relation)
+        apps.get_model(model).objects.update(**{field: Coalesce(Subquery(
+            relation.objects
+            .filter(**{key: OuterRef('pk')})
+            .order_by()
+            .values(key)
+            .annotate(count=Count('pk'))
+            .values('count')
+        ), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_ingredient_unique_ingredient'),
+        ('users', '0003_auto_20261018_0628'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлений в список покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
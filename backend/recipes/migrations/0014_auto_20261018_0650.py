@@ -0,0 +1,88 @@
+# Generated by Django 3.2.3 on 2026-10-18 06:50
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Q
+import django.db.models.deletion
+
+FANOUT_MAX_FOLLOWERS = 5000
+BACKFILL_MAX_RECIPES = 500
+
+
+def fill_timelines(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Follow = apps.get_model('recipes', 'Follow')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    TimelineEntry = apps.get_model('recipes', 'TimelineEntry')
+    User.objects.filter(
+        Q(followers_count__gte=FANOUT_MAX_FOLLOWERS)
+        | Q(recipes_count__gte=BACKFILL_MAX_RECIPES)
+    ).update(is_prolific=True)
+    quote = schema_editor.connection.ops.quote_name
+    schema_editor.execute(
+        'INSERT INTO {timeline} (user_id, recipe_id, author_id, pub_date) '
+        'SELECT f.user_id, r.id, r.author_id, r.pub_date FROM {follow} f '
+        'JOIN {user} a ON a.id = f.author_id '
+        'JOIN {recipe} r ON r.author_id = f.author_id '
+        'WHERE NOT a.is_prolific'.format(
+            timeline=quote(TimelineEntry._meta.db_table),
+            follow=quote(Follow._meta.db_table),
+            user=quote(User._meta.db_table),
+            recipe=quote(Recipe._meta.db_table),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0013_recipe_updated_at'),
+        ('users', '0004_customuser_is_prolific'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Ленты',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', 'pub_date', 'id'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор'),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', 'pub_date', 'recipe'], name='timeline_user_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', 'author'], name='timeline_user_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_timeline_entry'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 3.2.3 on 2026-10-18 06:53
+
+import math
+from datetime import datetime, timedelta, timezone
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+POPULAR_DECAY = timedelta(days=180)
+TRENDING_DECAY = timedelta(days=1)
+EPOCH = datetime(2023, 1, 1, tzinfo=timezone.utc)
+BATCH_SIZE = 5000
+
+
+def fill_rankings(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeRanking = apps.get_model('recipes', 'RecipeRanking')
+    rows = Recipe.objects.values_list(
+        'pk', 'pub_date', 'favorites_count', 'shopping_cart_count'
+    ).iterator()
+    rankings = []
+    for pk, pub_date, favorites, carts in rows:
+        interactions = favorites + carts
+        order = math.log10(max(interactions, 1))
+        age = (pub_date - EPOCH).total_seconds()
+        rankings.append(RecipeRanking(
+            recipe_id=pk,
+            interactions=interactions,
+            popular_score=order + age / POPULAR_DECAY.total_seconds(),
+            trending_score=order + age / TRENDING_DECAY.total_seconds(),
+        ))
+        if len(rankings) == BATCH_SIZE:
+            RecipeRanking.objects.bulk_create(rankings)
+            rankings = []
+    RecipeRanking.objects.bulk_create(rankings)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_auto_20261018_0650'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeRanking',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('interactions', models.PositiveIntegerField(default=0, verbose_name='Добавлений при расчёте')),
+                ('popular_score', models.FloatField(verbose_name='Оценка популярности')),
+                ('trending_score', models.FloatField(verbose_name='Оценка актуальности')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинги рецептов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='reciperanking',
+            index=models.Index(fields=['-popular_score', '-recipe'], name='ranking_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reciperanking',
+            index=models.Index(fields=['-trending_score', '-recipe'], name='ranking_trending_idx'),
+        ),
+        migrations.RunPython(fill_rankings, migrations.RunPython.noop),
+    ]
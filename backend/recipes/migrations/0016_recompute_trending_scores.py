@@ -0,0 +1,43 @@
+# Generated by Django 3.2.3 on 2026-10-18 07:40
+
+import math
+from datetime import datetime, timedelta, timezone
+
+from django.db import migrations
+
+TRENDING_DECAY = timedelta(days=7)
+EPOCH = datetime(2023, 1, 1, tzinfo=timezone.utc)
+BATCH_SIZE = 5000
+
+
+def recompute_trending_scores(apps, schema_editor):
+    # Период затухания trending увеличен с суток до недели: оценки,
+    # записанные 0015 и refresh_rankings, пересчитываются.
+    RecipeRanking = apps.get_model('recipes', 'RecipeRanking')
+    rows = RecipeRanking.objects.values_list(
+        'recipe_id', 'recipe__pub_date', 'interactions'
+    ).order_by('recipe_id').iterator()
+    rankings = []
+    for recipe_id, pub_date, interactions in rows:
+        order = math.log10(max(interactions, 1))
+        age = (pub_date - EPOCH).total_seconds()
+        rankings.append(RecipeRanking(
+            recipe_id=recipe_id,
+            trending_score=order + age / TRENDING_DECAY.total_seconds(),
+        ))
+        if len(rankings) == BATCH_SIZE:
+            RecipeRanking.objects.bulk_update(rankings, ['trending_score'])
+            rankings = []
+    RecipeRanking.objects.bulk_update(rankings, ['trending_score'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_auto_20261018_0653'),
+    ]
+
+    operations = [
+        migrations.RunPython(recompute_trending_scores,
+                             migrations.RunPython.noop),
+    ]
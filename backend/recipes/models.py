@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.core.validators import MinValueValidator
 
@@ -20,6 +21,12 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient',
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -89,10 +96,40 @@ class Recipe(models.Model):
         auto_now_add=True,
         db_index=True,
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        db_index=True,
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Добавлений в избранное',
+        default=0,
+        editable=False,
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        verbose_name='Добавлений в список покупок',
+        default=0,
+        editable=False,
+    )
+    # Заполняется триггером PostgreSQL из name и text (миграция 0012).
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+    )
 
     class Meta:
         ordering = ['-pub_date']
         default_related_name = 'recipes'
+        indexes = [
+            models.Index(
+                fields=['pub_date', 'id'],
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=['author', 'pub_date', 'id'],
+                name='recipe_author_pub_date_idx',
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['author', 'name'],
@@ -205,3 +242,91 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.recipe.name} был добавлен в список покупок.'
+
+
+class TimelineEntry(models.Model):
+    # Рецепт в ленте подписчика. Дата публикации и автор скопированы из
+    # рецепта для постраничного чтения по индексу и отписки без
+    # обращения к таблице рецептов.
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_timeline_entry',
+                                    )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'pub_date', 'recipe'],
+                name='timeline_user_pub_date_idx',
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='timeline_user_author_idx',
+            ),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты'
+
+    def __str__(self):
+        return f'{self.recipe_id} в ленте {self.user_id}.'
+
+
+class RecipeRanking(models.Model):
+    # Материализованные оценки для ?ordering=popular|trending,
+    # пересчитываются командой refresh_rankings (recipes/rankings.py).
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='ranking',
+        verbose_name='Рецепт',
+    )
+    interactions = models.PositiveIntegerField(
+        verbose_name='Добавлений при расчёте',
+        default=0,
+    )
+    popular_score = models.FloatField(
+        verbose_name='Оценка популярности',
+    )
+    trending_score = models.FloatField(
+        verbose_name='Оценка актуальности',
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['-popular_score', '-recipe'],
+                name='ranking_popular_idx',
+            ),
+            models.Index(
+                fields=['-trending_score', '-recipe'],
+                name='ranking_trending_idx',
+            ),
+        ]
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+
+    def __str__(self):
+        return f'Рейтинг рецепта {self.recipe_id}.'
@@ -0,0 +1,235 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes import cascades
+from recipes.counters import change_counters
+from recipes.images import schedule_variants
+from recipes.rankings import ranking
+from recipes.timelines import fan_out, follow_changed
+from recipes.models import (
+    Favorite,
+    Follow,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    Tag,
+    TagRecipe,
+)
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+INGREDIENTS_VERSION_KEY = 'recipes:ingredients:version'
+TAGS_VERSION_KEY = 'recipes:tags:version'
+
+# Поля пользователя, которые входят в представление рецепта.
+AUTHOR_FIELDS = {'username', 'email', 'first_name', 'last_name'}
+TOUCH_BATCH_SIZE = 1000
+
+touch_executor = ThreadPoolExecutor(max_workers=1,
+                                    thread_name_prefix='recipe-touch')
+
+
+def get_version(key):
+    return cache.get(key, 0)
+
+
+def bump_version(key):
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+        return 1
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(**kwargs):
+    bump_version(INGREDIENTS_VERSION_KEY)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(**kwargs):
+    bump_version(TAGS_VERSION_KEY)
+
+
+def touch_recipes(queryset):
+    # Представление рецептов включает теги, ингредиенты, автора и
+    # варианты картинки: их изменение меняет ETag рецептов.
+    queryset.update(updated_at=timezone.now())
+
+
+def linked_batches(queryset):
+    # Первичные ключи рецептов queryset пачками по возрастанию.
+    last_pk = 0
+    while True:
+        pks = list(queryset.filter(pk__gt=last_pk).order_by('pk')
+                   .values_list('pk', flat=True)[:TOUCH_BATCH_SIZE])
+        if not pks:
+            return
+        yield pks
+        last_pk = pks[-1]
+
+
+def chunked(pks):
+    pks = sorted(pks)
+    for start in range(0, len(pks), TOUCH_BATCH_SIZE):
+        yield pks[start:start + TOUCH_BATCH_SIZE]
+
+
+def touch_batches(batches):
+    # Вызывается в потоке touch_executor: каждая пачка — отдельное
+    # короткое обновление по первичному ключу.
+    try:
+        for pks in batches:
+            touch_recipes(Recipe.objects.filter(pk__in=pks))
+    except Exception:
+        logger.exception('Не удалось обновить дату изменения рецептов')
+    finally:
+        connection.close()
+
+
+def touch_later(batches):
+    # Тег или ингредиент может входить в большую часть рецептов: их
+    # отметка идёт после коммита в фоне, без долгой записи в таблицу
+    # рецептов в запросе админки.
+    transaction.on_commit(partial(touch_executor.submit, touch_batches,
+                                  batches))
+
+
+def variants_ready(name):
+    # Вызывается в потоке генерации вариантов.
+    try:
+        touch_recipes(Recipe.objects.filter(image=name))
+    finally:
+        connection.close()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(instance, **kwargs):
+    if instance.image:
+        storage, name = instance.image.storage, instance.image.name
+        transaction.on_commit(
+            lambda: schedule_variants(storage, name, variants_ready)
+        )
+
+
+@receiver(post_save, sender=Tag)
+def tag_touched(instance, **kwargs):
+    touch_later(linked_batches(Recipe.objects.filter(tags=instance.pk)))
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_touched(instance, **kwargs):
+    touch_later(linked_batches(
+        Recipe.objects.filter(ingredients=instance.pk)
+    ))
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def part_deleting(sender, instance, **kwargs):
+    # После удаления связи с рецептами исчезнут, поэтому рецепты
+    # выбираются заранее.
+    lookup = 'tags' if sender is Tag else 'ingredients'
+    touch_later(chunked(list(Recipe.objects.filter(
+        **{lookup: instance.pk}
+    ).values_list('pk', flat=True))))
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_save, sender=TagRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+@receiver(post_delete, sender=TagRecipe)
+def recipe_part_touched(instance, **kwargs):
+    # Правка количества или тега в админке. При удалении рецепта, тега
+    # или ингредиента строки удаляются каскадом, рецепты уже отмечены.
+    if not cascades.in_cascade(instance):
+        touch_recipes(Recipe.objects.filter(pk=instance.recipe_id))
+
+
+@receiver(post_save, sender=User)
+def author_touched(instance, created, update_fields, **kwargs):
+    # Вход (update_last_login) и другие частичные сохранения, которые
+    # не затрагивают автора в рецепте, не сбрасывают ETag его рецептов.
+    if created or (update_fields is not None
+                   and not AUTHOR_FIELDS.intersection(update_fields)):
+        return
+    touch_recipes(Recipe.objects.filter(author=instance))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_save, sender=Recipe)
+def counted_created(sender, instance, created, **kwargs):
+    if created:
+        change_counters(sender, [instance], 1)
+
+
+def uncount(instances):
+    relations = {}
+    for instance in instances:
+        relations.setdefault(type(instance), []).append(instance)
+    for relation, rows in relations.items():
+        change_counters(relation, rows, -1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Follow)
+@receiver(post_delete, sender=Recipe)
+def counted_deleted(sender, instance, **kwargs):
+    if cascades.in_cascade(instance):
+        cascades.defer(uncount, instance)
+    else:
+        change_counters(sender, [instance], -1)
+
+
+@receiver(pre_delete, sender=Recipe)
+@receiver(pre_delete, sender=User)
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def parent_deleting(instance, **kwargs):
+    # Строки, удаляемые каскадом вместе с родителем (избранное, списки
+    # покупок, подписки, рецепты автора, состав и теги рецептов),
+    # учитываются в конце удаления одним запросом на счётчик, а не
+    # отдельным UPDATE на каждую строку.
+    cascades.start(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def parent_deleted(instance, **kwargs):
+    cascades.finish(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(instance, created, **kwargs):
+    if created:
+        fan_out(instance)
+        ranking(instance.pk, instance.pub_date, 0).save(force_insert=True)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(instance, created, **kwargs):
+    if created:
+        follow_changed(instance.user_id, instance.author_id, 1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(instance, **kwargs):
+    # Записи лент удаляемого пользователя удалит каскад.
+    if not cascades.in_cascade(instance):
+        follow_changed(instance.user_id, instance.author_id, -1)
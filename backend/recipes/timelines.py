@@ -0,0 +1,127 @@
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Q
+
+from recipes.models import Follow, Recipe, TimelineEntry
+
+User = get_user_model()
+
+# Рецепты автора с большим числом подписчиков дорого рассылать при
+# публикации, а автора с большим числом рецептов — копировать в ленту
+# при подписке. Такие авторы читаются при запросе ленты.
+FANOUT_MAX_FOLLOWERS = 5000
+BACKFILL_MAX_RECIPES = 500
+
+PROLIFIC = (Q(followers_count__gte=FANOUT_MAX_FOLLOWERS)
+            | Q(recipes_count__gte=BACKFILL_MAX_RECIPES))
+
+
+def timeline_sql():
+    quote = connection.ops.quote_name
+
+    def column(model, field):
+        return quote(model._meta.get_field(field).column)
+
+    return {
+        'timeline': quote(TimelineEntry._meta.db_table),
+        'timeline_columns': ', '.join(
+            column(TimelineEntry, field)
+            for field in ('user', 'recipe', 'author', 'pub_date')
+        ),
+        'follow': quote(Follow._meta.db_table),
+        'follow_user': column(Follow, 'user'),
+        'follow_author': column(Follow, 'author'),
+        'recipe': quote(Recipe._meta.db_table),
+        'recipe_pk': column(Recipe, 'id'),
+        'recipe_author': column(Recipe, 'author'),
+        'recipe_pub_date': column(Recipe, 'pub_date'),
+        'user': quote(User._meta.db_table),
+        'user_pk': column(User, 'id'),
+        'user_prolific': column(User, 'is_prolific'),
+    }
+
+
+def is_prolific(author_id):
+    # Признак не снимается: иначе рецепты, опубликованные, пока автор
+    # был популярным, пропали бы из лент его подписчиков.
+    author = (User.objects.filter(pk=author_id)
+              .values('is_prolific', 'followers_count', 'recipes_count')
+              .first())
+    if author is None or author['is_prolific']:
+        return author is not None
+    if (author['followers_count'] < FANOUT_MAX_FOLLOWERS
+            and author['recipes_count'] < BACKFILL_MAX_RECIPES):
+        return False
+    User.objects.filter(pk=author_id).update(is_prolific=True)
+    return True
+
+
+@transaction.atomic
+def fan_out(recipe):
+    # Один INSERT ... SELECT по подпискам на автора, без выборки
+    # подписчиков в Python.
+    if is_prolific(recipe.author_id):
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {timeline} ({timeline_columns}) '
+            'SELECT {follow_user}, %s, %s, %s FROM {follow} '
+            'WHERE {follow_author} = %s '
+            'ON CONFLICT DO NOTHING'.format(**timeline_sql()),
+            [recipe.pk, recipe.author_id,
+             connection.ops.adapt_datetimefield_value(recipe.pub_date),
+             recipe.author_id],
+        )
+        return cursor.rowcount
+
+
+@transaction.atomic
+def backfill(user_id, author_id):
+    if is_prolific(author_id):
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {timeline} ({timeline_columns}) '
+            'SELECT %s, {recipe_pk}, {recipe_author}, {recipe_pub_date} '
+            'FROM {recipe} WHERE {recipe_author} = %s '
+            'ON CONFLICT DO NOTHING'.format(**timeline_sql()),
+            [user_id, author_id],
+        )
+        return cursor.rowcount
+
+
+def follow_changed(user_id, author_id, delta):
+    if delta > 0:
+        backfill(user_id, author_id)
+    else:
+        TimelineEntry.objects.filter(user_id=user_id,
+                                     author_id=author_id).delete()
+
+
+@transaction.atomic
+def rebuild_timelines(user_ids=None):
+    # Для данных, записанных в обход сигналов. Возвращает число записей.
+    User.objects.filter(PROLIFIC, is_prolific=False).update(is_prolific=True)
+    names = timeline_sql()
+    sql = (
+        'INSERT INTO {timeline} ({timeline_columns}) '
+        'SELECT f.{follow_user}, r.{recipe_pk}, r.{recipe_author}, '
+        'r.{recipe_pub_date} FROM {follow} f '
+        'JOIN {user} a ON a.{user_pk} = f.{follow_author} '
+        'JOIN {recipe} r ON r.{recipe_author} = f.{follow_author} '
+        'WHERE NOT a.{user_prolific}'.format(**names)
+    )
+    entries = TimelineEntry.objects.all()
+    params = []
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return 0
+        entries = entries.filter(user_id__in=user_ids)
+        sql += ' AND f.{} IN ({})'.format(names['follow_user'],
+                                          ', '.join(['%s'] * len(user_ids)))
+        params = user_ids
+    entries.delete()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
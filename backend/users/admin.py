@@ -6,7 +6,9 @@ User = get_user_model()
 
 @admin.register(User)
 class ShoppingCartAdmin(admin.ModelAdmin):
-    list_display = ('pk', 'email', 'username', 'first_name', 'last_name')
+    list_display = ('pk', 'email', 'username', 'first_name', 'last_name',
+                    'recipes_count', 'followers_count')
     search_fields = ('username', 'email', 'first_name', 'last_name')
-    list_filter = ('username', 'email')
+    list_filter = ('role', 'is_active')
+    show_full_result_count = False
     empty_value_display = '--NONE--'
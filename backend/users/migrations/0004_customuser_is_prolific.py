@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-18 06:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_auto_20261018_0628'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='is_prolific',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Популярный автор'),
+        ),
+    ]
@@ -28,6 +28,23 @@ class CustomUser(AbstractUser):
         choices=Role.choices,
         default=Role.user,
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+        editable=False,
+    )
+    # Рецепты популярного автора не рассылаются по лентам подписчиков,
+    # а читаются при запросе ленты (recipes/timelines.py).
+    is_prolific = models.BooleanField(
+        verbose_name='Популярный автор',
+        default=False,
+        editable=False,
+    )
     objects = CustomUserManager()
 
     class Meta: